@@ -1,8 +1,8 @@
 from __future__ import annotations
+import functools
 import os
 import json
-import random
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import Collection, List, Dict, Any, Optional, Tuple, Union
 from sklearn.base import BaseEstimator, TransformerMixin
 import numpy as np
 import math
@@ -46,6 +46,16 @@ def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return 2 * R * math.asin(math.sqrt(a))
 
 
+def _haversine_segments_km(coords: np.ndarray) -> np.ndarray:
+    """Great-circle length of each consecutive segment of an (N, 2) lat/lng array."""
+    R = 6371.0088
+    phi = np.radians(coords[:, 0])
+    dphi = np.diff(phi)
+    dlambda = np.radians(np.diff(coords[:, 1]))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dlambda / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+
 def _polyline_bbox_area_km2(viewport: Dict[str, Any] | None) -> float:
     """Approximate area from viewport bounds if present."""
     if not viewport or "low" not in viewport or "high" not in viewport:
@@ -55,48 +65,86 @@ def _polyline_bbox_area_km2(viewport: Dict[str, Any] | None) -> float:
     lat2, lon2 = high.get("latitude"), high.get("longitude")
     if None in (lat1, lon1, lat2, lon2):
         return float("nan")
+    return _bbox_area_km2(lat1, lon1, lat2, lon2)
+
+
+@functools.lru_cache(maxsize=4096)
+def _bbox_area_km2(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Memoized on the exact corners: routes reranked along the same corridor share a viewport
     # Approximate area by multiplying edge lengths in km (haversine across edges)
     width_km = _haversine_km(lat1, lon1, lat1, lon2)
     height_km = _haversine_km(lat1, lon1, lat2, lon1)
     return width_km * height_km
 
 
-def _entropy(counts: List[int]) -> float:
+def _entropy(counts: Collection[int]) -> float:
+    """Shannon entropy (nats) of a few category counts, e.g. a dict's values()."""
     total = sum(counts)
     if total <= 0:
         return 0.0
-    ent = 0.0
-    for c in counts:
-        if c > 0:
-            p = c / total
-            ent -= p * math.log(p + 1e-12)
-    return ent
+    log = math.log
+    return -sum(c / total * log(c / total + 1e-12) for c in counts if c > 0)
 
 #############################
 # Feature Extractor
 #############################
 
 class RouteFeatureExtractor(BaseEstimator, TransformerMixin):
-    """Transforms a list of route dicts into a list of flat feature dicts.
-
-    Each route becomes a dictionary of numeric/categorical features
-    compatible with DictVectorizer.
+    """Transforms a list of route dicts into a dense feature matrix.
+
+    ``fit`` collects every feature key seen in training into a sorted column
+    index (``feature_names_``, the same order DictVectorizer uses) and
+    ``transform`` writes each route's features straight into an
+    ``(n_routes, n_features)`` array; unseen keys are dropped and absent ones
+    are 0. Without a column index (unfitted, or unpickled from a Pipeline
+    saved with a DictVectorizer step) ``transform`` returns the per-route
+    feature dicts as before.
     """
 
     def __init__(self, random_state: int | None = 42):
+        # Feature extraction draws no random numbers; the parameter is kept so
+        # existing pickles and get_params()/clone() see the same signature.
         self.random_state = random_state
-        random.seed(random_state)
-        np.random.seed(random_state if random_state is not None else None)
 
     def fit(self, X: List[Dict[str, Any]], y: Any = None):
-        # Stateless
+        self._set_columns(self._features(X))
         return self
 
-    def transform(self, X: List[Dict[str, Any]]) -> List[Dict[str, float]]:
-        feats: List[Dict[str, float]] = []
-        for r in X:
-            feats.append(self._one_route_features(r))
-        return feats
+    def fit_transform(self, X: List[Dict[str, Any]], y: Any = None, **fit_params) -> np.ndarray:
+        # Extract once for both the column index and the matrix
+        feats = self._features(X)
+        self._set_columns(feats)
+        return self._to_matrix(feats)
+
+    def transform(self, X: List[Dict[str, Any]]) -> Union[np.ndarray, List[Dict[str, float]]]:
+        feats = self._features(X)
+        if getattr(self, "feature_index_", None) is None:
+            return feats
+        return self._to_matrix(feats)
+
+    def _features(self, X: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+        return [self._one_route_features(r) for r in X]
+
+    def _set_columns(self, feats: List[Dict[str, float]]) -> None:
+        self.feature_names_ = sorted({k for f in feats for k in f})
+        self.feature_index_ = {name: j for j, name in enumerate(self.feature_names_)}
+
+    def _to_matrix(self, feats: List[Dict[str, float]]) -> np.ndarray:
+        index = self.feature_index_
+        # Keep float64: the fitted LR weights are large and cancel each other,
+        # so a float32 fit or float32 scoring shifts the predicted scores.
+        # Stay dense too: about 80% of the entries are non-zero, and a
+        # scipy.sparse input makes LinearRegression solve with lsqr, which
+        # lands on different weights. Writing each row in place was also
+        # faster than collecting COO triples for one scatter.
+        out = np.zeros((len(feats), len(index)), dtype=np.float64)
+        for i, f in enumerate(feats):
+            row = out[i]
+            for k, v in f.items():
+                j = index.get(k)
+                if j is not None:
+                    row[j] = v
+        return out
 
     # --- per-route feature engineering ---
     def _one_route_features(self, r: Dict[str, Any]) -> Dict[str, float]:
@@ -140,73 +188,78 @@ class RouteFeatureExtractor(BaseEstimator, TransformerMixin):
 
         f["waypoint_count"] = float(len(wps))
 
-        ratings = [
-            _safe_float(w.get("rating"))
-            for w in wps
-            if isinstance(w, dict) and w.get("rating") is not None
-        ]
-        ratings = [x for x in ratings if not math.isnan(x)]
+        # One pass over the waypoints collects the inputs of every aggregate below
+        ratings: List[float] = []
+        # Flat [lat0, lng0, lat1, lng1, ...]: no tuple per waypoint, and NumPy
+        # converts a flat float list faster than a list of pairs
+        latlng: List[float] = []
+        declared_dists: List[float] = []
+        cat_counts: Dict[str, int] = {}
+        search_cat_counts: Dict[str, int] = {}
+        for w in wps:
+            if not isinstance(w, dict):
+                continue
+            rating = w.get("rating")
+            if rating is not None:
+                x = _safe_float(rating)
+                if not math.isnan(x):
+                    ratings.append(x)
+            loc = w.get("location") or {}
+            lat, lng = loc.get("lat"), loc.get("lng")
+            if lat is not None and lng is not None:
+                latlng.append(float(lat))
+                latlng.append(float(lng))
+            dist_km = w.get("distance_km")
+            if dist_km is not None:
+                x = _safe_float(dist_km)
+                if not math.isnan(x):
+                    declared_dists.append(x)
+            cat = (w.get("category") or "").strip().lower()
+            if cat:
+                cat_counts[cat] = cat_counts.get(cat, 0) + 1
+            scat = (w.get("search_category") or "").strip().lower()
+            if scat:
+                search_cat_counts[scat] = search_cat_counts.get(scat, 0) + 1
+
         if ratings:
-            f["wp_rating_mean"] = float(np.mean(ratings))
-            f["wp_rating_min"] = float(np.min(ratings))
-            f["wp_rating_max"] = float(np.max(ratings))
-            f["wp_rating_std"] = float(np.std(ratings))
+            # A route has a handful of waypoints, too few to pay for building
+            # a NumPy array. Two passes like np.mean/np.std, so short lists give
+            # the same bits.
+            n = len(ratings)
+            mean = sum(ratings) / n
+            f["wp_rating_mean"] = mean
+            f["wp_rating_min"] = min(ratings)
+            f["wp_rating_max"] = max(ratings)
+            f["wp_rating_std"] = math.sqrt(sum((x - mean) * (x - mean) for x in ratings) / n)
 
         # ----------------------------
         # ✅ 4. Waypoint coordinate distance features
         # ----------------------------
-        coords: List[Tuple[float, float]] = []
-        for w in wps:
-            loc = (w.get("location") if isinstance(w, dict) else {}) or {}
-            lat, lng = loc.get("lat"), loc.get("lng")
-            if lat is not None and lng is not None:
-                coords.append((float(lat), float(lng)))
-
-        if len(coords) >= 2:
-            segs = [
-                _haversine_km(coords[i][0], coords[i][1], coords[i + 1][0], coords[i + 1][1])
-                for i in range(len(coords) - 1)
-            ]
-            f["wp_path_len_km"] = float(sum(segs))
-            f["wp_path_mean_seg_km"] = float(np.mean(segs))
-            f["wp_path_max_seg_km"] = float(np.max(segs))
+        if len(latlng) >= 4:
+            segs = _haversine_segments_km(np.array(latlng, dtype=np.float64).reshape(-1, 2))
+            f["wp_path_len_km"] = float(segs.sum())
+            f["wp_path_mean_seg_km"] = float(segs.mean())
+            f["wp_path_max_seg_km"] = float(segs.max())
 
         # ----------------------------
         # ✅ 5. Waypoint declared distance aggregates
         # ----------------------------
-        declared_dists = [
-            _safe_float(w.get("distance_km"))
-            for w in wps
-            if isinstance(w, dict) and w.get("distance_km") is not None
-        ]
-        declared_dists = [x for x in declared_dists if not math.isnan(x)]
         if declared_dists:
-            f["wp_declared_dist_sum_km"] = float(sum(declared_dists))
-            f["wp_declared_dist_mean_km"] = float(np.mean(declared_dists))
+            total_km = sum(declared_dists)
+            f["wp_declared_dist_sum_km"] = float(total_km)
+            f["wp_declared_dist_mean_km"] = total_km / len(declared_dists)
 
         # ----------------------------
         # ✅ 6. Category / search category distribution and entropy
         # ----------------------------
-        cat_counts: Dict[str, int] = {}
-        search_cat_counts: Dict[str, int] = {}
-        for w in wps:
-            if not isinstance(w, dict):
-                continue
-            cat = (w.get("category") or "").strip().lower()
-            if cat:
-                cat_counts[cat] = cat_counts.get(cat, 0) + 1
-            scat = (w.get("search_category") or "").strip().lower()
-            if scat:
-                search_cat_counts[scat] = search_cat_counts.get(scat, 0) + 1
-
         if cat_counts:
             f["wp_cat_unique"] = float(len(cat_counts))
-            f["wp_cat_entropy"] = _entropy(list(cat_counts.values()))
+            f["wp_cat_entropy"] = _entropy(cat_counts.values())
             for k, v in cat_counts.items():
                 f[f"wp_cat={k}"] = float(v)
         if search_cat_counts:
             f["wp_search_cat_unique"] = float(len(search_cat_counts))
-            f["wp_search_cat_entropy"] = _entropy(list(search_cat_counts.values()))
+            f["wp_search_cat_entropy"] = _entropy(search_cat_counts.values())
             for k, v in search_cat_counts.items():
                 f[f"wp_search_cat={k}"] = float(v)
 
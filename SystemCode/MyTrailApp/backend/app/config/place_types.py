@@ -5,6 +5,8 @@ Simplified configuration with only essential types and functions.
 
 from typing import Dict, List
 
+import numpy as np
+
 
 # Essential Google Places API types for trail/route generation
 COMMON_GOOGLE_TYPES = {
@@ -84,6 +86,62 @@ for category, google_types in CUSTOM_CATEGORY_MAPPING.items():
         GOOGLE_TYPE_TO_CATEGORIES[google_type].append(category)
 
 
+# Category priority (higher index = higher priority)
+CATEGORY_PRIORITY = [
+    "accommodation",
+    "transport",
+    "health",
+    "sports",
+    "shopping",
+    "culture",
+    "attraction",
+    "cafe",
+    "restaurant",
+    "park",
+]
+
+# Type lists at least this long are resolved with the NumPy lookup tables below;
+# shorter lists are cheaper to walk in plain Python.
+VECTORIZED_MIN_TYPES = 16
+CATEGORY_NAMES: List[str] = list(CUSTOM_CATEGORY_MAPPING)
+
+
+def _category_rank(category: str) -> int:
+    """Rank used to pick the primary category (higher wins).
+
+    Prioritized categories always outrank the rest; among unprioritized
+    categories the one listed first in CUSTOM_CATEGORY_MAPPING wins.
+    """
+    if category in CATEGORY_PRIORITY:
+        return len(CATEGORY_NAMES) + CATEGORY_PRIORITY.index(category)
+    return len(CATEGORY_NAMES) - 1 - CATEGORY_NAMES.index(category)
+
+
+def _build_category_tables():
+    """Build the lookup tables for the vectorized primary-category path.
+
+    Each supported type gets an id; the rank table holds the rank of its best
+    category and the category table the index of that category in CATEGORY_NAMES.
+    """
+    type_to_id: Dict[str, int] = {}
+    ranks: List[int] = []
+    best_categories: List[int] = []
+    supported = sorted(t for t in GOOGLE_TYPE_TO_CATEGORIES if t in COMMON_GOOGLE_TYPES)
+    for google_type in supported:
+        best = max(GOOGLE_TYPE_TO_CATEGORIES[google_type], key=_category_rank)
+        type_to_id[google_type] = len(type_to_id)
+        ranks.append(_category_rank(best))
+        best_categories.append(CATEGORY_NAMES.index(best))
+    return (
+        type_to_id,
+        np.array(ranks, dtype=np.int8),
+        np.array(best_categories, dtype=np.int8),
+    )
+
+
+TYPE_TO_ID, RANK_TABLE, CATEGORY_TABLE = _build_category_tables()
+
+
 def get_google_types_for_category(category: str) -> List[str]:
     """Get Google Places API types for a given custom category."""
     return CUSTOM_CATEGORY_MAPPING.get(category, [])
@@ -101,19 +159,8 @@ def is_valid_google_type(place_type: str) -> bool:
 
 def get_primary_category_for_types(place_types: List[str]) -> str:
     """Get the primary (most relevant) category for a list of place types."""
-    # Category priority (higher index = higher priority)
-    category_priority = [
-        "accommodation",
-        "transport",
-        "health",
-        "sports",
-        "shopping",
-        "culture",
-        "attraction",
-        "cafe",
-        "restaurant",
-        "park",
-    ]
+    if len(place_types) >= VECTORIZED_MIN_TYPES:
+        return _get_primary_category_vectorized(place_types)
 
     # Find categories for all place types
     found_categories = set()
@@ -122,18 +169,28 @@ def get_primary_category_for_types(place_types: List[str]) -> str:
             categories = get_categories_for_google_type(place_type)
             found_categories.update(categories)
 
-    # Return the highest priority category found
-    for category in reversed(category_priority):
-        if category in found_categories:
-            return category
-
-    # If no priority category found, return first available category
+    # Return the highest priority category found, falling back to the
+    # first unprioritized category in mapping order
     if found_categories:
-        return list(found_categories)[0]
+        return max(found_categories, key=_category_rank)
 
     return "other"
 
 
+def _get_primary_category_vectorized(place_types: List[str]) -> str:
+    """Resolve the primary category with one gather + argmax over the lookup tables."""
+    ids = np.fromiter(
+        (TYPE_TO_ID.get(t, -1) for t in place_types),
+        dtype=np.int16,
+        count=len(place_types),
+    )
+    ids = ids[ids >= 0]
+    if not ids.size:
+        return "other"
+    best = ids[np.argmax(RANK_TABLE[ids])]
+    return CATEGORY_NAMES[CATEGORY_TABLE[best]]
+
+
 def filter_supported_types(google_types: List[str]) -> List[str]:
     """Filter a list of Google types to only include supported ones."""
     seen = set()
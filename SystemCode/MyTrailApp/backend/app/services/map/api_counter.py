@@ -27,6 +27,24 @@ class APICounter:
         
         return current_calls < settings.max_api_calls_per_day
     
+    def try_reserve_call(self) -> bool:
+        """Check the limit and record one call in a single step.
+
+        Concurrent callers on the event loop cannot all pass the check
+        before any of them is counted. Pair with release_call() if the
+        reserved call does not go through.
+        """
+        if not self.can_make_call():
+            return False
+        self.record_call()
+        return True
+
+    def release_call(self) -> None:
+        """Give back a call reserved with try_reserve_call()"""
+        today_key = date.today().isoformat()
+        if self.call_count.get(today_key, 0) > 0:
+            self.call_count[today_key] -= 1
+
     def record_call(self) -> None:
         """Record one API call"""
         today = date.today()
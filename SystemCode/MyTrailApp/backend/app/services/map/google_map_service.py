@@ -29,8 +29,8 @@ class GoogleMapService(MapService):
         self, center: Tuple[float, float], radius_km: float, categories: List[str]
     ) -> List[Dict]:
         """Search nearby places using Google Places API (New) v1"""
-        # Check API call limit
-        if not api_counter.can_make_call():
+        # Reserve the call up front so concurrent searches cannot overshoot the limit
+        if not api_counter.try_reserve_call():
             raise Exception(
                 f"API call limit exceeded. Max calls per day: {settings.max_api_calls_per_day}"
             )
@@ -56,6 +56,7 @@ class GoogleMapService(MapService):
         if google_types:
             body["includedTypes"] = google_types
 
+        call_succeeded = False
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
@@ -69,9 +70,7 @@ class GoogleMapService(MapService):
                     timeout=10.0,
                 )
                 response.raise_for_status()
-
-                # Record API call
-                api_counter.record_call()
+                call_succeeded = True
 
                 data = response.json()
 
@@ -101,6 +100,10 @@ class GoogleMapService(MapService):
                 )
         except Exception as e:
             raise Exception(f"Failed to fetch places: {str(e)}")
+        finally:
+            # Failed requests were never counted before; give the reservation back
+            if not call_succeeded:
+                api_counter.release_call()
 
     async def _find_nearest_navigable_point(
         self, center: Tuple[float, float]
@@ -1,3 +1,4 @@
+import asyncio
 import random
 import math
 from typing import List, Dict, Tuple, Optional
@@ -66,6 +67,45 @@ class RouteGenerationService:
         optimized = [wp[0] for wp in waypoints_with_angle]
         return optimize_waypoint_order_by_two_opt(optimized)
 
+    async def _search_waypoint_candidates(
+        self,
+        center: Tuple[float, float],
+        radius_km: float,
+        categories: List[str],
+    ) -> List[Dict]:
+        """
+        Search nearby places for every category concurrently.
+
+        Each response is converted while the remaining requests are still in
+        flight. Places are returned in category order and tagged with their
+        search_category; a category whose search fails is logged and skipped.
+        """
+        search_results = await asyncio.gather(
+            *(
+                self.map_service.find_nearby_places(
+                    center=center, radius_km=radius_km, categories=[category]
+                )
+                for category in categories
+            ),
+            return_exceptions=True,
+        )
+
+        candidates = []
+        for category, places in zip(categories, search_results):
+            # BaseException so a cancelled child search is skipped too
+            if isinstance(places, BaseException):
+                print(f"   ⚠️ Error searching {category}: {str(places)}")
+                continue
+
+            # Add category info to each place for tracking
+            for place in places:
+                place["search_category"] = category
+                candidates.append(place)
+
+            print(f"   Found {len(places)} {category} places")
+
+        return candidates
+
     async def generate_candidate_routes(
         self, criteria: RouteCriteria, max_routes: int = 20
     ) -> List[Dict]:
@@ -95,24 +135,9 @@ class RouteGenerationService:
 
         # Step 2: Search for places in each category
         print(f"🔍 Searching for waypoints within {search_radius}km of center...")
-        all_waypoint_candidates = []
-
-        for category in target_categories:
-            try:
-                places = await self.map_service.find_nearby_places(
-                    center=center_tuple, radius_km=search_radius, categories=[category]
-                )
-
-                # Add category info to each place for tracking
-                for place in places:
-                    place["search_category"] = category
-                    all_waypoint_candidates.append(place)
-
-                print(f"   Found {len(places)} {category} places")
-
-            except Exception as e:
-                print(f"   ⚠️ Error searching {category}: {str(e)}")
-                continue
+        all_waypoint_candidates = await self._search_waypoint_candidates(
+            center_tuple, search_radius, target_categories
+        )
 
         if not all_waypoint_candidates:
             print("❌ No waypoint candidates found")
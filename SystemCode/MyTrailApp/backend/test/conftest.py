@@ -0,0 +1,8 @@
+"""Shared pytest configuration: make the backend ``app`` package importable."""
+
+from pathlib import Path
+import sys
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
@@ -1,13 +1,8 @@
 """Unit tests for the persisted route clustering service."""
 
 from pathlib import Path
-import sys
 from typing import List, Tuple
 
-BACKEND_ROOT = Path(__file__).resolve().parents[1]
-if str(BACKEND_ROOT) not in sys.path:
-    sys.path.insert(0, str(BACKEND_ROOT))
-
 from app.services.route.clustering_service import RouteClusteringService
 
 
@@ -5,11 +5,7 @@ Test for feedback API endpoint
 import requests
 import json
 import sys
-import os
 
-# Add backend directory to path for imports
-backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, backend_dir)
 
 def test_feedback_api():
     """Test the feedback API endpoint"""
@@ -5,10 +5,6 @@ Tests the integration between GoogleMapService and place_types configuration
 
 import asyncio
 import sys
-import os
-
-# Add the parent directory to the path so we can import our modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.map.google_map_service import GoogleMapService
 from app.config.place_types import *
@@ -139,6 +135,30 @@ async def test_place_type_management():
         return False
 
 
+def test_primary_category_long_type_lists():
+    """Long type lists take the NumPy path and must agree with the Python loop"""
+    short_cases = [
+        ["park", "restaurant", "cafe"],
+        ["museum", "shopping_mall", "library"],
+        ["bus_station", "hospital", "bank"],
+        ["marina", "tourist_attraction", "bakery"],
+        ["invalid_1", "unknown_type", "not_supported"],
+        # Only unprioritized categories (nature, food, waterfront)
+        ["bar", "hiking_area"],
+        ["bakery", "marina"],
+    ]
+    padding = ["invalid_type"] * VECTORIZED_MIN_TYPES
+
+    for types in short_cases:
+        expected = get_primary_category_for_types(types)
+        long_types = padding + types + types[::-1]
+        assert get_primary_category_for_types(long_types) == expected
+
+    # Unprioritized categories fall back to mapping order on both paths
+    assert get_primary_category_for_types(["bar", "hiking_area"]) == "nature"
+    assert get_primary_category_for_types(["bakery", "marina"]) == "waterfront"
+
+
 if __name__ == "__main__":
     success = asyncio.run(test_place_type_management())
     if success:
@@ -1,11 +1,6 @@
 """Unit tests for the persisted route ranking service."""
 
 from pathlib import Path
-import sys
-
-BACKEND_ROOT = Path(__file__).resolve().parents[1]
-if str(BACKEND_ROOT) not in sys.path:
-    sys.path.insert(0, str(BACKEND_ROOT))
 
 from app.services.route.ranking_service import RouteRankingService
 
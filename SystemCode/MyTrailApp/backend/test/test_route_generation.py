@@ -5,12 +5,8 @@ Tests the generate_candidate_routes functionality
 
 import asyncio
 import sys
-import os
 import json
 
-# Add the parent directory to the path so we can import our modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from app.services.route.generation_service import RouteGenerationService
 from app.models.request import RouteCriteria, Center
 
@@ -176,6 +172,44 @@ async def test_edge_cases():
     print("✅ Edge case testing completed")
 
 
+class _StubMapService:
+    """Returns canned places per category; 'fail' categories raise"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    async def find_nearby_places(self, center, radius_km, categories):
+        category = categories[0]
+        if category in self.failing:
+            raise Exception(f"search failed for {category}")
+        # Later categories answer first so completion order differs from input order
+        await asyncio.sleep(0.001 * (4 - len(category) % 4))
+        return [{"name": f"{category}-{i}"} for i in range(2)]
+
+
+def test_search_waypoint_candidates_concurrent():
+    """Concurrent search keeps category order, tags places and skips failures"""
+    categories = ["park", "nature", "attraction", "restaurant"]
+    service = RouteGenerationService(map_service=_StubMapService(failing={"nature"}))
+
+    candidates = asyncio.run(
+        service._search_waypoint_candidates((1.2834, 103.8607), 2.0, categories)
+    )
+
+    assert [place["name"] for place in candidates] == [
+        "park-0",
+        "park-1",
+        "attraction-0",
+        "attraction-1",
+        "restaurant-0",
+        "restaurant-1",
+    ]
+    assert all(
+        place["search_category"] == place["name"].split("-")[0]
+        for place in candidates
+    )
+
+
 if __name__ == "__main__":
     print("🔧 Starting Route Generation Tests...")
 
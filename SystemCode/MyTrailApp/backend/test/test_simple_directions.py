@@ -4,13 +4,14 @@ Simple test for Google Routes API - get_directions interface
 """
 import asyncio
 import sys
-import os
+from pathlib import Path
 import webbrowser
 import tempfile
 
 # Add project path
-backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, backend_dir)
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
 
 from app.services.map.google_map_service import GoogleMapService
 from app.config import settings
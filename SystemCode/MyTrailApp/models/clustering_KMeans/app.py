@@ -9,7 +9,7 @@ import joblib
 from fastapi import FastAPI
 from pydantic import BaseModel
 from sklearn.base import BaseEstimator, TransformerMixin
-from route_feature import RouteFeatureExtractor, parse_duration_seconds, safe_get, viewport_area, duration_per_km
+from route_feature import RouteFeatureExtractor, group_by_label, parse_duration_seconds, safe_get, viewport_area, duration_per_km
 # ========= theme inference utils =========
 def distance_bucket(distance_m: float) -> str:
     if np.isnan(distance_m): return "Unknown"
@@ -23,13 +23,12 @@ def infer_theme_name(routes_in_cluster: List[Dict[str, Any]]) -> str:
     distances, ratings = [], []
     for r in routes_in_cluster:
         distances.append(r.get("distance", np.nan))
-        for w in r.get("waypoints", []) or []:
-            for key in ("category", "search_category"):
-                c = (w.get(key) or "").strip().title()
-                if c:
-                    cat_counter[c] += 1
-        rv = [w.get("rating") for w in r.get("waypoints", []) or [] if w.get("rating") is not None]
-        ratings.extend(rv)
+        wps = r.get("waypoints", []) or []
+        cat_counter.update(c for w in wps for c in (
+            (w.get("category") or "").strip().title(),
+            (w.get("search_category") or "").strip().title(),
+        ) if c)
+        ratings.extend(w.get("rating") for w in wps if w.get("rating") is not None)
 
     top = cat_counter.most_common(2)
     if top and (len(top) == 1 or (len(top) == 2 and top[0][1] >= top[1][1] * 1.2)):
@@ -53,6 +52,23 @@ if not os.path.exists(MODEL_PATH):
     raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
 pipe = joblib.load(MODEL_PATH)
 
+# Fold the StandardScaler into the centroids so serving needs only the feature
+# extractor and one matmul. In scaled space
+#   |(x - m)/s - c|^2 = |x/s|^2 - 2 x.((c + m/s)/s) + |c + m/s|^2
+# and |x/s|^2 is the same for every centroid, so it drops out of the argmin.
+_extractor, _scaler, _kmeans = pipe.steps[0][1], pipe.steps[1][1], pipe.steps[-1][1]
+_centers = np.asarray(_kmeans.cluster_centers_, dtype=np.float64)
+_inv_scale = 1.0 / _scaler.scale_ if getattr(_scaler, "scale_", None) is not None else np.ones(_centers.shape[1])
+_shift = _scaler.mean_ * _inv_scale if getattr(_scaler, "mean_", None) is not None else 0.0
+_shifted = _centers + _shift
+CENTROID_WEIGHTS = (_shifted * _inv_scale).T
+CENTROID_BIAS = np.einsum("ij,ij->i", _shifted, _shifted)
+
+def predict_cluster_labels(routes: List[Dict[str, Any]]) -> np.ndarray:
+    """Same labels as pipe.predict, computed on unscaled features."""
+    X = np.asarray(_extractor.transform(routes), dtype=np.float64)
+    return (CENTROID_BIAS - 2.0 * (X @ CENTROID_WEIGHTS)).argmin(axis=1)
+
 # ========= API =========
 app = FastAPI(title="MyTrail Cluster Service", version="1.0.0")
 
@@ -68,14 +84,9 @@ def predict(payload: PredictBody):
     routes = payload.routes or []
     if not routes:
         return {"themes":[]}
-    labels = pipe.predict(routes)  # pipeline: RouteFeatureExtractor -> StandardScaler -> (MiniBatch)KMeans
-    cluster_to_routes = defaultdict(list)
-    for r, lbl in zip(routes, labels):
-        cluster_to_routes[int(lbl)].append(r)
-
+    labels = predict_cluster_labels(routes)  # pipeline: RouteFeatureExtractor -> StandardScaler -> (MiniBatch)KMeans
     used, themes = {}, []
-    for idx, cid in enumerate(sorted(cluster_to_routes.keys())):
-        group = cluster_to_routes[cid]
+    for idx, (cid, group) in enumerate(group_by_label(routes, labels)):
         name = infer_theme_name(group)
         themes.append({"id": f"theme_{idx+1}", "ThemeName": name, "Routes": group})
     return {"themes": themes}
@@ -83,5 +94,5 @@ def predict(payload: PredictBody):
 @app.post("/predict_labels")
 def predict_labels(payload: PredictBody):
     routes = payload.routes or []
-    labels = pipe.predict(routes) if routes else []
+    labels = predict_cluster_labels(routes) if routes else []
     return {"labels": [int(x) for x in labels]}
\ No newline at end of file
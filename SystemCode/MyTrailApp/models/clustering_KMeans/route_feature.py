@@ -1,19 +1,23 @@
+import re
 import numpy as np
 import pandas as pd
-from sklearn.base import BaseEstimator, TransformerMixin
-from typing import Any, Dict, List
+from sklearn.base import BaseEstimator, ClusterMixin, TransformerMixin
+from typing import Any, Dict, List, Tuple
 from collections import Counter
 from collections import  defaultdict
 
+# "<number>" or "<number>s" (Google's duration format), matched without
+# using exceptions for control flow; covers what float() accepted before.
+_DIGITS = r"\d(?:_?\d)*"
+_DURATION_RE = re.compile(
+    rf"([+-]?(?:(?:{_DIGITS}(?:\.(?:{_DIGITS})?)?|\.{_DIGITS})(?:e[+-]?{_DIGITS})?|inf(?:inity)?|nan))\s*s?"
+)
+
 def parse_duration_seconds(d: Any) -> float:
     if d is None: return np.nan
     if isinstance(d, (int, float)): return float(d)
-    s = str(d).strip().lower()
-    if s.endswith("s"):
-        try: return float(s[:-1])
-        except: return np.nan
-    try: return float(s)
-    except: return np.nan
+    m = _DURATION_RE.fullmatch(str(d).strip().lower())
+    return float(m.group(1)) if m else np.nan
 
 def safe_get(d: dict, *keys, default=None):
     cur = d
@@ -36,6 +40,38 @@ def duration_per_km(distance_m: Any, duration_s: Any) -> float:
     if dkm and dkm > 0 and pd.notna(ds): return ds / dkm
     return np.nan
 
+BASE_FEATURES = (
+    "distance_m", "duration_s", "n_waypoints", "avg_rating", "max_rating",
+    "search_radius_km", "predicted_score", "score", "viewport_area", "sec_per_km",
+)
+
+# Filled column-wise after the per-route loop
+DERIVED_FEATURES = ("avg_rating", "max_rating", "viewport_area", "sec_per_km")
+
+def _viewport_corners(geometry: dict) -> Tuple[Any, Any, Any, Any]:
+    """viewport low/high lat/lng with safe_get's semantics (missing -> NaN), in one walk."""
+    vp = geometry.get("viewport") if isinstance(geometry, dict) else None
+    low = vp.get("low") if isinstance(vp, dict) else None
+    high = vp.get("high") if isinstance(vp, dict) else None
+    if not isinstance(low, dict): low = {}
+    if not isinstance(high, dict): high = {}
+    corners = (low.get("latitude"), low.get("longitude"), high.get("latitude"), high.get("longitude"))
+    return tuple(np.nan if v is None else v for v in corners)
+
+def _rating_stats(route_ids: List[int], ratings: List[Any], n_routes: int):
+    """Per-route mean and max rating from flattened (route, rating) pairs; NaN where a route has none."""
+    route_ids = np.asarray(route_ids, dtype=np.intp)
+    ratings = np.asarray(ratings, dtype=np.float64)
+    counts = np.bincount(route_ids, minlength=n_routes)
+    sums = np.bincount(route_ids, weights=ratings, minlength=n_routes)
+    maxima = np.full(n_routes, -np.inf)
+    np.maximum.at(maxima, route_ids, ratings)
+    has = counts > 0
+    avg = np.full(n_routes, np.nan)
+    avg[has] = sums[has] / counts[has]
+    maxima[~has] = np.nan
+    return avg, maxima
+
 class RouteFeatureExtractor(BaseEstimator, TransformerMixin):
     def __init__(self, top_k_categories: int = 12):
         self.top_k_categories = top_k_categories
@@ -55,48 +91,147 @@ class RouteFeatureExtractor(BaseEstimator, TransformerMixin):
             if rt: route_type_counter[rt] += 1
         self.fitted_categories_ = [c for c, _ in cat_counter.most_common(self.top_k_categories)]
         self.fitted_route_types_ = [t for t, _ in route_type_counter.most_common()]
+        self._build_column_index()
         return self
 
+    def _build_column_index(self) -> None:
+        # Sorted column -> index mapping, computed once per fit. Pipelines
+        # pickled before it existed build it lazily on first transform.
+        names = [f"cat_{c}_ratio" for c in getattr(self, "fitted_categories_", [])]
+        names += [f"route_type_{t}" for t in getattr(self, "fitted_route_types_", [])]
+        names += BASE_FEATURES
+        self.feature_names_ = sorted(set(names))
+        self._col_index: Dict[str, int] = {n: i for i, n in enumerate(self.feature_names_)}
+        self._n_features = len(self.feature_names_)
+        # Fitted category / route type -> output column, for O(1) lookups per waypoint
+        self._cat_index: Dict[str, int] = {
+            c: self._col_index[f"cat_{c}_ratio"] for c in getattr(self, "fitted_categories_", [])
+        }
+        self._rt_index: Dict[str, int] = {
+            t: self._col_index[f"route_type_{t}"] for t in getattr(self, "fitted_route_types_", [])
+        }
+        self._cat_cols = np.fromiter(self._cat_index.values(), dtype=np.intp, count=len(self._cat_index))
+
     def transform(self, X: List[Dict[str, Any]]):
-        rows = []
-        for r in X:
+        if getattr(self, "_col_index", None) is None:
+            self._build_column_index()
+        cat_index, rt_index, cat_cols = self._cat_index, self._rt_index, self._cat_cols
+        base_cols = [self._col_index[name] for name in BASE_FEATURES if name not in DERIVED_FEATURES]
+
+        n = len(X)
+        out = np.zeros((n, self._n_features), dtype=np.float64)
+        # Waypoint-level values flattened across all routes, aggregated below
+        # with a few NumPy calls instead of per-route list/array work.
+        rating_route: List[int] = []
+        rating_values: List[Any] = []
+        hit_route: List[int] = []
+        hit_col: List[int] = []
+        cat_totals = np.zeros(n, dtype=np.float64)
+        viewport = np.full((n, 4), np.nan)  # low_lat, low_lng, high_lat, high_lng
+        for i, r in enumerate(X):
+            row = out[i]
             distance = r.get("distance", np.nan)
             duration_s = parse_duration_seconds(r.get("duration"))
             wps = r.get("waypoints", []) or []
             n_wp = len(wps)
-            ratings = [w.get("rating") for w in wps if w.get("rating") is not None]
-            avg_rating = np.mean(ratings) if ratings else np.nan
-            max_rating = np.max(ratings) if ratings else np.nan
-
-            cat_counts = Counter()
+            # One pass over the waypoints; the ratio denominator still counts
+            # categories outside the fitted top-k.
+            n_cats = 0
             for w in wps:
+                rating = w.get("rating")
+                if rating is not None:
+                    rating_route.append(i)
+                    rating_values.append(rating)
                 for key in ("category", "search_category"):
                     c = (w.get(key) or "").strip().lower()
-                    if c: cat_counts[c] += 1
-
-            row: Dict[str, Any] = {}
-            total_cats = sum(cat_counts.values()) or 1
-            for c in getattr(self, "fitted_categories_", []):
-                row[f"cat_{c}_ratio"] = cat_counts.get(c, 0) / total_cats
+                    if c:
+                        n_cats += 1
+                        j = cat_index.get(c)
+                        if j is not None:
+                            hit_route.append(i)
+                            hit_col.append(j)
+            cat_totals[i] = n_cats
 
             search_radius = safe_get(r, "metadata", "search_radius_km", default=np.nan)
             route_type = safe_get(r, "metadata", "route_type", default=None)
-            for t in getattr(self, "fitted_route_types_", []):
-                row[f"route_type_{t}"] = 1.0 if route_type == t else 0.0
+            if route_type in rt_index:
+                row[rt_index[route_type]] = 1.0
 
             predicted_score = safe_get(r, "metadata", "predicted_score", default=np.nan)
             user_score = r.get("score", np.nan)
-            area = viewport_area(r.get("geometry", {}) or {})
-            pace = duration_per_km(distance, duration_s)
-
-            row.update(dict(
-                distance_m=distance, duration_s=duration_s, n_waypoints=n_wp,
-                avg_rating=avg_rating, max_rating=max_rating, search_radius_km=search_radius,
-                predicted_score=predicted_score, score=user_score, viewport_area=area, sec_per_km=pace
-            ))
-            rows.append(row)
-
-        df = pd.DataFrame(rows).fillna(0.0)
-        df = df[sorted(df.columns)]
-        self.feature_names_ = list(df.columns)
-        return df.values
\ No newline at end of file
+            viewport[i] = _viewport_corners(r.get("geometry", {}) or {})
+
+            values = (distance, duration_s, n_wp, search_radius,
+                      predicted_score, user_score)
+            for j, v in zip(base_cols, values):
+                if v is not None:
+                    row[j] = v
+
+        np.add.at(out, (np.asarray(hit_route, dtype=np.intp), np.asarray(hit_col, dtype=np.intp)), 1.0)
+        out[:, cat_cols] /= np.maximum(cat_totals, 1.0)[:, None]
+
+        # viewport_area() and duration_per_km() for all routes at once; NaN
+        # inputs give NaN, as in the scalar versions.
+        col = self._col_index
+        out[:, col["viewport_area"]] = (np.abs(viewport[:, 2] - viewport[:, 0])
+                                        * np.abs(viewport[:, 3] - viewport[:, 1]))
+        dist_km = out[:, col["distance_m"]] / 1000
+        pace = np.full(n, np.nan)
+        np.divide(out[:, col["duration_s"]], dist_km, out=pace, where=dist_km > 0)
+        out[:, col["sec_per_km"]] = pace
+
+        avg_rating, max_rating = _rating_stats(rating_route, rating_values, n)
+        out[:, self._col_index["avg_rating"]] = avg_rating
+        out[:, self._col_index["max_rating"]] = max_rating
+
+        # Missing values become 0.0, as DataFrame.fillna(0.0) did before
+        out[np.isnan(out)] = 0.0
+        return out
+
+
+def group_by_label(items: List[Any], labels) -> List[Tuple[int, List[Any]]]:
+    """(label, items) per non-empty cluster, ascending label, input order kept within a cluster."""
+    labels = np.asarray(labels, dtype=np.int64)
+    if labels.size == 0:
+        return []
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    ends = np.r_[starts[1:], sorted_labels.size]
+    return [
+        (int(sorted_labels[start]), [items[i] for i in order[start:end]])
+        for start, end in zip(starts, ends)
+    ]
+
+
+class FaissKMeans(BaseEstimator, ClusterMixin):
+    """KMeans trained with faiss (SIMD/GEMM Lloyd iterations), sklearn-compatible.
+
+    Only fit() needs faiss; predict() uses the stored centroids, so a pickled
+    pipeline containing this estimator loads and serves without faiss installed.
+    """
+
+    def __init__(self, n_clusters: int = 8, niter: int = 20, nredo: int = 5, random_state: int = 1234):
+        self.n_clusters = n_clusters
+        self.niter = niter
+        self.nredo = nredo
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        try:
+            import faiss
+        except ImportError as exc:
+            raise ImportError("FaissKMeans requires faiss: pip install faiss-cpu") from exc
+        Xf = np.ascontiguousarray(X, dtype=np.float32)
+        km = faiss.Kmeans(Xf.shape[1], self.n_clusters, niter=self.niter, nredo=self.nredo,
+                          seed=self.random_state, verbose=False)
+        km.train(Xf)
+        self.cluster_centers_ = np.asarray(km.centroids, dtype=np.float64)
+        self.labels_ = self.predict(X)
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        C = self.cluster_centers_
+        d = np.einsum("ij,ij->i", X, X)[:, None] - 2.0 * (X @ C.T) + np.einsum("ij,ij->i", C, C)
+        return d.argmin(axis=1)
@@ -22,7 +22,12 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import MiniBatchKMeans, KMeans
 from sklearn.metrics import silhouette_score
 import joblib
-from route_feature import RouteFeatureExtractor, parse_duration_seconds, safe_get, viewport_area, duration_per_km
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+from joblib import Parallel, delayed
+from route_feature import FaissKMeans, RouteFeatureExtractor, group_by_label, parse_duration_seconds, safe_get, viewport_area, duration_per_km
 
 
 
@@ -65,24 +70,65 @@ def infer_theme_name(routes_in_cluster: List[Dict[str, Any]]) -> str:
 
 
 # ---------- 读取你上传的文件 ----------
+_TRAILING_COMMA = re.compile(r",\s*\]")
+_LEADING_COMMA = re.compile(r"\[\s*,")
+
+
+def _loads(text: str):
+    # orjson（Rust 实现）更快；不支持 NaN/Infinity 等扩展写法，失败时退回标准 json
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
 def load_routes_tolerant(path: Path) -> List[Dict[str, Any]]:
     txt = path.read_text(encoding="utf-8")
     # 尝试当成“一个 JSON 数组的内容”来包裹
     wrapped = "[" + txt + "]"
-    wrapped = re.sub(r",\s*\]", "]", wrapped)   # 去掉末尾多逗号
-    wrapped = re.sub(r"\[\s*,", "[", wrapped)   # 去掉开头多逗号
-    data = json.loads(wrapped)
+    wrapped = _TRAILING_COMMA.sub("]", wrapped)   # 去掉末尾多逗号
+    wrapped = _LEADING_COMMA.sub("[", wrapped)    # 去掉开头多逗号
+    data = _loads(wrapped)
     # 只取 dict 且包含 id 的对象
     return [x for x in data if isinstance(x, dict) and "id" in x]
 
 
 # ---------- 训练 ----------
+SILHOUETTE_SAMPLE_SIZE = 5000
+
+
+def _make_kmeans(kk: int, random_state: int, backend: str = "sklearn", **kwargs):
+    """backend="faiss" 用 faiss 训练（需安装 faiss-cpu / faiss-gpu），否则用 sklearn。"""
+    if backend == "faiss":
+        return FaissKMeans(n_clusters=kk, niter=20, nredo=5, random_state=random_state)
+    return MiniBatchKMeans(n_clusters=kk, n_init=20, random_state=random_state, **kwargs)
+
+
+def _fit_one(kk: int, Xs: np.ndarray, random_state: int, backend: str = "sklearn"):
+    """拟合一个 k，返回 (k, silhouette, model)；失败或退化时 model 为 None。"""
+    n_samples = Xs.shape[0]
+    try:
+        model = _make_kmeans(kk, random_state, backend, batch_size=256)
+        labels = model.fit_predict(Xs)
+        if len(set(labels)) <= 1 or len(set(labels)) >= n_samples:
+            return kk, -1.0, None
+        # silhouette 是 O(n²)，样本多时只在子样本上估计
+        sample_size = SILHOUETTE_SAMPLE_SIZE if n_samples > SILHOUETTE_SAMPLE_SIZE else None
+        s = silhouette_score(Xs, labels, sample_size=sample_size, random_state=random_state)
+        return kk, s, model
+    except Exception:
+        return kk, -1.0, None
+
+
 def train_and_export(
     routes: List[Dict[str, Any]],
     outdir: Path,
     k: int = None,
     auto_k: Optional[Tuple[int, int]] = None,
     random_state: int = 42,
+    backend: str = "sklearn",
 ):
     outdir.mkdir(parents=True, exist_ok=True)
     feat = RouteFeatureExtractor(top_k_categories=12)
@@ -99,25 +145,24 @@ def train_and_export(
         n_samples = Xs.shape[0]
         k_max = min(k_max, max(2, n_samples - 1))
         best_k, best_score, best_model = None, -1.0, None
-        for kk in range(max(2, k_min), k_max + 1):
-            try:
-                model = MiniBatchKMeans(n_clusters=kk, n_init=20, random_state=random_state, batch_size=256)
-                labels = model.fit_predict(Xs)
-                if len(set(labels)) <= 1 or len(set(labels)) >= n_samples:
-                    continue
-                s = silhouette_score(Xs, labels)
-                if s > best_score:
-                    best_k, best_score, best_model = kk, s, model
-            except Exception:
-                continue
+        # 各个 k 相互独立，并行拟合；结果按 k 的顺序返回，平分时仍取较小的 k
+        results = Parallel(n_jobs=-1, backend="loky")(
+            delayed(_fit_one)(kk, Xs, random_state, backend) for kk in range(max(2, k_min), k_max + 1)
+        )
+        for kk, s, model in results:
+            if model is not None and s > best_score:
+                best_k, best_score, best_model = kk, s, model
         if best_model is None:
             best_k = min(3, max(2, X.shape[0] - 1))
-            best_model = MiniBatchKMeans(n_clusters=best_k, n_init=20, random_state=random_state).fit(Xs)
+            best_model = _make_kmeans(best_k, random_state, backend).fit(Xs)
         model = best_model
         chosen_k = best_k
     else:
         Xs = scaler.fit_transform(X)
-        model = KMeans(n_clusters=k, n_init=20, random_state=random_state).fit(Xs)
+        if backend == "faiss":
+            model = _make_kmeans(k, random_state, backend).fit(Xs)
+        else:
+            model = KMeans(n_clusters=k, n_init=20, random_state=random_state).fit(Xs)
         chosen_k = k
 
     pipe: Pipeline = make_pipeline(feat, scaler, model)
@@ -125,13 +170,8 @@ def train_and_export(
 
     # 预测与导出 JSON
     labels = model.predict(Xs)
-    cluster_to_routes = defaultdict(list)
-    for r, lbl in zip(routes, labels):
-        cluster_to_routes[int(lbl)].append(r)
-
     themes = []
-    for idx, cluster_id in enumerate(sorted(cluster_to_routes.keys())):
-        group = cluster_to_routes[cluster_id]
+    for idx, (cluster_id, group) in enumerate(group_by_label(routes, labels)):
         theme_name = infer_theme_name(group) if group else f"Theme {idx+1}"
         themes.append(
             {"id": f"theme_{idx+1}", "ThemeName": theme_name, "Routes": group}
@@ -156,6 +196,8 @@ def main():
     group.add_argument("--k", type=int, help="手动指定聚类个数（= 主题数）")
     group.add_argument("--auto-k", nargs=2, type=int, metavar=("K_MIN", "K_MAX"),
                        help="自动选择 k 的范围（含端点），例如 --auto-k 2 10")
+    ap.add_argument("--backend", choices=("sklearn", "faiss"), default="sklearn",
+                    help="KMeans 实现；faiss 需要 pip install faiss-cpu（或 faiss-gpu）")
     args = ap.parse_args()
 
     routes = load_routes_tolerant(args.data)
@@ -163,10 +205,10 @@ def main():
         raise RuntimeError(f"没有从 {args.data} 解析到任何 route")
 
     if args.k is not None:
-        info = train_and_export(routes, args.outdir, k=args.k)
+        info = train_and_export(routes, args.outdir, k=args.k, backend=args.backend)
     else:
         auto = tuple(args.auto_k) if args.auto_k else (2, 10)
-        info = train_and_export(routes, args.outdir, k=None, auto_k=auto)
+        info = train_and_export(routes, args.outdir, k=None, auto_k=auto, backend=args.backend)
 
     print(f"✅ 训练完成：k={info['k']}, routes={info['n_routes']}")
     print(f"📦 模型：{args.outdir / 'route_cluster_model.pkl'}")
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+import torch
+from transformers import AutoTokenizer
+
+from src.modeling import JointIntentSlotModel, LogitsOnly, load_trained_weights
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export the trained joint intent/slot model to ONNX.")
+    parser.add_argument("--model_dir", type=Path, default=Path("trained_model"), help="Directory with the trained model.")
+    parser.add_argument("--output", type=Path, default=None, help="ONNX file to write (default: <model_dir>/model.onnx).")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    model_dir: Path = args.model_dir
+    output: Path = args.output or model_dir / "model.onnx"
+
+    with (model_dir / "label_maps.json").open("r", encoding="utf-8") as f:
+        label_data = json.load(f)
+    metadata_path = model_dir / "metadata.json"
+    encoder_name = "microsoft/deberta-v3-base"
+    if metadata_path.exists():
+        with metadata_path.open("r", encoding="utf-8") as f:
+            encoder_name = json.load(f).get("encoder_name", encoder_name)
+
+    device = torch.device("cpu")
+    model = JointIntentSlotModel(
+        encoder_name=encoder_name,
+        num_intents=len(label_data["intent2id"]),
+        num_slots=len(label_data["slot2id"]),
+    )
+    load_trained_weights(model, model_dir, device)
+    model.eval()
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    sample = tokenizer(
+        [["plan", "a", "5", "km", "loop", "near", "the", "park"]],
+        is_split_into_words=True,
+        return_tensors="pt",
+    )
+
+    torch.onnx.export(
+        LogitsOnly(model),
+        (sample["input_ids"], sample["attention_mask"]),
+        str(output),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["intent_logits", "slot_logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "intent_logits": {0: "batch"},
+            "slot_logits": {0: "batch", 1: "sequence"},
+        },
+        opset_version=args.opset,
+        do_constant_folding=True,
+    )
+    print(f"Exported ONNX model to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Gunicorn settings for the NLU service: gunicorn -c gunicorn.conf.py app:app
+
+On CPU the app and the model are loaded once in the master process and the
+workers are forked from it, so they share the read-only weight pages instead
+of each loading a copy. CUDA cannot be used across fork(), so on a GPU nothing
+is loaded in the master: each worker loads its own copy of the model onto the
+GPU after it starts. Keep NLU_WORKERS small there (every worker holds the
+weights in GPU memory) and scale with threads (e.g. NLU_WORKERS=1 NLU_THREADS=4).
+"""
+import os
+
+workers = int(os.getenv("NLU_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# app.py divides the cores between the workers when sizing torch's thread pool
+os.environ["NLU_WORKERS"] = str(workers)
+
+from app import DEVICE, HOST, PORT
+
+bind = f"{HOST}:{PORT}"
+preload_app = DEVICE.type == "cpu"
+threads = int(os.getenv("NLU_THREADS", "1"))
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before any
+    # worker is forked, so on CPU the model is instantiated exactly once.
+    if DEVICE.type == "cpu":
+        from app import get_service
+
+        get_service()
+
+
+def post_worker_init(worker):
+    # On a GPU the model is created inside each worker, after the fork, so the
+    # first request does not pay for loading it.
+    if DEVICE.type != "cpu":
+        from app import get_service
+
+        get_service()
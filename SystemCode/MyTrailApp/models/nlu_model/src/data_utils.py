@@ -40,57 +40,11 @@ def build_label_maps(examples: Iterable[Dict[str, Any]]) -> LabelMaps:
     )
 
 
-def compute_word_ids(tokenizer, tokenized, tokens: List[str]) -> List[Optional[int]]:
-    try:
-        return tokenized.word_ids()  # type: ignore[attr-defined]
-    except ValueError:
-        return build_word_ids_slow(tokenizer, tokenized, tokens)
-
-
-def build_word_ids_slow(tokenizer, tokenized, tokens: List[str]) -> List[Optional[int]]:
-    input_ids: List[int] = tokenized["input_ids"]
-    special_tokens_mask: Optional[List[int]] = tokenized.get("special_tokens_mask")
-    pad_token_id = tokenizer.pad_token_id
-    all_special_ids = set(tokenizer.all_special_ids)
-
-    # Pre-tokenize each original token to know how many pieces it expands to
-    per_token_pieces: List[List[int]] = [
-        tokenizer.encode(token, add_special_tokens=False) for token in tokens
-    ]
-
-    word_ids: List[Optional[int]] = []
-    current_word_idx = -1
-    piece_offset = 0
-    current_pieces: List[int] = []
-
-    for position, token_id in enumerate(input_ids):
-        is_special = False
-        if special_tokens_mask is not None and position < len(special_tokens_mask):
-            is_special = bool(special_tokens_mask[position])
-        if not is_special and (token_id == pad_token_id or token_id in all_special_ids):
-            is_special = True
-
-        if is_special:
-            word_ids.append(None)
-            continue
-
-        if piece_offset == 0:
-            current_word_idx += 1
-            if current_word_idx >= len(per_token_pieces):
-                word_ids.append(None)
-                continue
-            current_pieces = per_token_pieces[current_word_idx]
-            if not current_pieces:
-                word_ids.append(None)
-                continue
-
-        word_ids.append(current_word_idx)
-        piece_offset += 1
-
-        if piece_offset >= len(current_pieces):
-            piece_offset = 0
-
-    return word_ids
+def compute_word_ids(tokenized, batch_index: Optional[int] = None) -> List[Optional[int]]:
+    """Word id per position; pass batch_index when `tokenized` holds a batch."""
+    if batch_index is None:
+        return tokenized.word_ids()
+    return tokenized.word_ids(batch_index)
 
 
 class IntentSlotDataset(Dataset):
@@ -123,7 +77,7 @@ class IntentSlotDataset(Dataset):
             add_special_tokens=True,
             return_special_tokens_mask=True,
         )
-        word_ids = compute_word_ids(self.tokenizer, tokenized, list(tokens))
+        word_ids = compute_word_ids(tokenized)
 
         aligned_slot_labels: List[int] = []
         slot_ids = [self.label_maps.slot2id[label] for label in slot_labels]
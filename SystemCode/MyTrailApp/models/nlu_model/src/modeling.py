@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+from pathlib import Path
+from typing import Dict, Optional, Tuple
 
 import torch
 import torch.nn as nn
+from safetensors.torch import load_model
 from transformers import AutoModel
 
 
@@ -47,6 +49,9 @@ class JointIntentSlotModel(nn.Module):
         loss = None
         if intent_labels is not None and slot_labels is not None:
             intent_loss = self.intent_loss_fn(intent_logits, intent_labels)
+            # Only first sub-tokens carry a label; padding, special tokens and
+            # continuation pieces (-100) are skipped through ignore_index, which
+            # keeps the shapes static (no host sync or torch.compile graph break).
             slot_loss = self.slot_loss_fn(
                 slot_logits.view(-1, slot_logits.size(-1)),
                 slot_labels.view(-1),
@@ -59,3 +64,25 @@ class JointIntentSlotModel(nn.Module):
             "slot_logits": slot_logits,
         }
 
+
+def load_trained_weights(model: JointIntentSlotModel, model_dir: Path, device: torch.device) -> None:
+    """Load trained weights into `model`, which must already be on `device`."""
+    safetensors_path = model_dir / "model.safetensors"
+    if safetensors_path.exists():
+        # Memory-mapped and loaded straight onto the device, no pickle round-trip
+        load_model(model, str(safetensors_path), device=str(device))
+    else:
+        state_dict = torch.load(model_dir / "pytorch_model.bin", map_location=device)
+        model.load_state_dict(state_dict)
+
+
+class LogitsOnly(nn.Module):
+    """Wraps the joint model so it returns (intent_logits, slot_logits), e.g. for ONNX export."""
+
+    def __init__(self, model: JointIntentSlotModel) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
+        return outputs["intent_logits"], outputs["slot_logits"]
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
 
 from data_example.dictionary_whitelist import CANON_LOOKUP, ROUTE_TYPE_MAP
 from data_example.schema import RouteCriteria
@@ -25,98 +25,74 @@ class SlotSpan:
 
 
 def bio_to_spans(slots: Sequence[Dict[str, str]]) -> List[SlotSpan]:
+    words = [slot.get("word", "") for slot in slots]
     spans: List[SlotSpan] = []
     current_label: Optional[str] = None
-    current_tokens: List[str] = []
-    start_idx: Optional[int] = None
+    current_tag: Optional[str] = None
+    start: int = 0
 
     for idx, slot in enumerate(slots):
         raw_label = slot.get("label", "O")
-        token = slot.get("word", "")
-        if not raw_label or raw_label == "O":
-            if current_label is not None and current_tokens:
-                spans.append(
-                    SlotSpan(
-                        label=current_label,
-                        tokens=tuple(current_tokens),
-                        start=start_idx if start_idx is not None else idx - len(current_tokens),
-                        end=idx - 1,
-                    )
-                )
-            current_label = None
-            current_tokens = []
-            start_idx = None
-            continue
+        prefix, _, tag = raw_label.partition("-") if raw_label else ("O", "", "")
 
-        prefix, _, tag = raw_label.partition("-")
-        if prefix not in ("B", "I") or not tag:
-            # Treat malformed tags as outside
-            if current_label is not None and current_tokens:
-                spans.append(
-                    SlotSpan(
-                        label=current_label,
-                        tokens=tuple(current_tokens),
-                        start=start_idx if start_idx is not None else idx - len(current_tokens),
-                        end=idx - 1,
-                    )
-                )
-            current_label = None
-            current_tokens = []
-            start_idx = None
+        # Continue the open span on a matching I- tag
+        if prefix == "I" and tag and tag == current_tag:
             continue
 
-        if prefix == "B" or tag != (current_label.split("-", 1)[-1] if current_label else None):
-            if current_label is not None and current_tokens:
-                spans.append(
-                    SlotSpan(
-                        label=current_label,
-                        tokens=tuple(current_tokens),
-                        start=start_idx if start_idx is not None else idx - len(current_tokens),
-                        end=idx - 1,
-                    )
-                )
-            current_label = raw_label
-            current_tokens = [token]
-            start_idx = idx
+        if current_label is not None:
+            spans.append(SlotSpan(label=current_label, tokens=tuple(words[start:idx]), start=start, end=idx - 1))
+
+        if prefix in ("B", "I") and tag:
+            # B- tag, or an I- tag that does not continue the open span
+            current_label, current_tag, start = raw_label, tag, idx
         else:
-            current_tokens.append(token)
+            # O or a malformed tag is treated as outside
+            current_label, current_tag = None, None
 
-    if current_label is not None and current_tokens:
+    if current_label is not None:
         spans.append(
-            SlotSpan(
-                label=current_label,
-                tokens=tuple(current_tokens),
-                start=start_idx if start_idx is not None else len(slots) - len(current_tokens),
-                end=len(slots) - 1,
-            )
+            SlotSpan(label=current_label, tokens=tuple(words[start:]), start=start, end=len(slots) - 1)
         )
 
     return spans
 
 
+_LEADING_NONWORD_RE = re.compile(r"^[^\w]+")
+_TRAILING_NONWORD_RE = re.compile(r"[^\w]+$")
+_NUMBER_RE = re.compile(r"[-+]?\d*\.?\d+")
+# ASCII characters that \w does not match (punctuation, whitespace, controls)
+_ASCII_NONWORD_CHARS = "".join(ch for ch in map(chr, range(128)) if not (ch.isalnum() or ch == "_"))
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
 def _clean_token(token: str) -> str:
-    token = token.strip().lower()
-    token = token.replace("’", "'")
-    token = re.sub(r"^[^\w]+", "", token)
-    token = re.sub(r"[^\w]+$", "", token)
+    token = token.strip().lower().replace("’", "'").strip(_ASCII_NONWORD_CHARS)
+    # Non-ASCII punctuation at either end (e.g. "…", "«") still needs the regexes
+    if token and not (_is_word_char(token[0]) and _is_word_char(token[-1])):
+        token = _LEADING_NONWORD_RE.sub("", token)
+        token = _TRAILING_NONWORD_RE.sub("", token)
     return token
 
 
+# From the first to the last word character of a "-"-free run: exactly what
+# _clean_token keeps of each hyphen-separated part, internal "." and ":" included
+_CLEANED_PART_RE = re.compile(r"\w(?:[^-]*\w)?")
+
+
 def _tokens_lower(tokens: Iterable[str]) -> List[str]:
-    lowered: List[str] = []
-    for token in tokens:
-        if "-" in token:
-            lowered.extend(_clean_token(part) for part in token.split("-") if part)
-        else:
-            lowered.append(_clean_token(token))
-    return [t for t in lowered if t]
+    # Joining on "-" splits tokens and hyphenated parts alike, so one findall
+    # over the lowered text replaces a _clean_token call per part.
+    return _CLEANED_PART_RE.findall("-".join(tokens).lower().replace("’", "'"))
 
 
 def _extract_first_number(tokens: Iterable[str]) -> Optional[float]:
     for token in tokens:
         if not token:
             continue
-        match = re.search(r"[-+]?\d*\.?\d+", token)
+        match = _NUMBER_RE.search(token)
         if match:
             try:
                 return float(match.group())
@@ -171,15 +147,20 @@ def _normalize_elevation(tokens: Sequence[str]) -> Optional[int]:
     return int(round(value))
 
 
+# Space-insensitive variant -> canonical route type. An exact match is also a
+# match without spaces, so one lookup covers both comparisons; setdefault keeps
+# the first canonical in ROUTE_TYPE_MAP order if two ever share a variant.
+_VARIANT_TO_CANONICAL: Dict[str, str] = {}
+for _canonical, _variants in ROUTE_TYPE_MAP.items():
+    for _variant in _variants:
+        _VARIANT_TO_CANONICAL.setdefault(_variant.replace(" ", ""), _canonical)
+
+
 def _normalize_route_type(tokens: Sequence[str]) -> Optional[str]:
     text = " ".join(_tokens_lower(tokens))
     if not text:
         return None
-    for canonical, variants in ROUTE_TYPE_MAP.items():
-        for variant in variants:
-            if text == variant or text.replace(" ", "") == variant.replace(" ", ""):
-                return canonical
-    return None
+    return _VARIANT_TO_CANONICAL.get(text.replace(" ", ""))
 
 
 def _normalize_category(tokens: Sequence[str]) -> Optional[str]:
@@ -194,43 +175,57 @@ def _normalize_category(tokens: Sequence[str]) -> Optional[str]:
     return text
 
 
-_TIME_PATTERN = re.compile(r"(\d{1,2}(?::\d{2})?)")
-
-
-def _parse_time_token(value: str) -> Tuple[int, int]:
-    if ":" in value:
-        hour_str, minute_str = value.split(":", 1)
-        return int(hour_str), int(minute_str)
-    return int(value), 0
+# Hour, optional minutes and an optional am/pm written with the time
+# ("7pm", "7:30 am"); \b keeps "5 amazing" from reading as 5am.
+_TIME_PATTERN = re.compile(r"(?P<h>\d{1,2})(?::(?P<m>\d{2}))?(?:\s*(?P<mer>am|pm)\b)?")
 
 
 def _format_time(hour: int, minute: int) -> str:
     return f"{hour:02d}:{minute:02d}"
 
 
+# Checked in order; "early morning" must come before "morning"
+_KEYWORD_RANGES: Tuple[Tuple[FrozenSet[str], Tuple[str, str]], ...] = (
+    (frozenset({"early", "morning"}), ("05:00", "07:00")),
+    (frozenset({"morning"}), ("08:00", "10:00")),
+    (frozenset({"afternoon"}), ("12:00", "15:00")),
+    (frozenset({"evening"}), ("18:00", "21:00")),
+    (frozenset({"tonight"}), ("18:00", "21:00")),
+    (frozenset({"weekend"}), ("12:00", "15:00")),
+)
+
+
 def _normalize_time_window(tokens: Sequence[str]) -> Optional[Dict[str, str]]:
     lowered_tokens = _tokens_lower(tokens)
     if not lowered_tokens:
         return None
 
     token_text = " ".join(lowered_tokens)
-    meridiem_hint: Optional[str] = None
-    if "pm" in lowered_tokens:
-        meridiem_hint = "pm"
-    elif "am" in lowered_tokens:
-        meridiem_hint = "am"
-
-    matches = list(_TIME_PATTERN.finditer(token_text))
     times_24h: List[Tuple[int, int]] = []
-    if matches:
-        for match in matches:
-            hour, minute = _parse_time_token(match.group(1))
-            if meridiem_hint == "pm" and hour < 12:
-                hour += 12
-            elif meridiem_hint == "am" and hour == 12:
-                hour = 0
-            times_24h.append((hour, minute))
-
+    meridiem_hint: Optional[str] = None
+    hint_checked = False
+    # Only the first two times are used
+    for match in _TIME_PATTERN.finditer(token_text):
+        hour, minute = int(match.group("h")), int(match.group("m") or 0)
+        meridiem = match.group("mer")
+        if meridiem is None:
+            # Fall back to a standalone "pm"/"am" anywhere in the span
+            if not hint_checked:
+                if "pm" in lowered_tokens:
+                    meridiem_hint = "pm"
+                elif "am" in lowered_tokens:
+                    meridiem_hint = "am"
+                hint_checked = True
+            meridiem = meridiem_hint
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+        times_24h.append((hour, minute))
+        if len(times_24h) == 2:
+            break
+
+    if times_24h:
         if len(times_24h) >= 2:
             start_hour, start_minute = times_24h[0]
             end_hour, end_minute = times_24h[1]
@@ -245,96 +240,51 @@ def _normalize_time_window(tokens: Sequence[str]) -> Optional[Dict[str, str]]:
                 "end_local": _format_time(min(start_hour + 2, 23), start_minute),
             }
 
-    keyword_ranges = [
-        ({"early", "morning"}, ("05:00", "07:00")),
-        ({"morning"}, ("08:00", "10:00")),
-        ({"afternoon"}, ("12:00", "15:00")),
-        ({"evening"}, ("18:00", "21:00")),
-        ({"tonight"}, ("18:00", "21:00")),
-        ({"weekend"}, ("12:00", "15:00")),
-    ]
-    token_set = set(lowered_tokens)
-    for keywords, (start, end) in keyword_ranges:
+    token_set = frozenset(lowered_tokens)
+    for keywords, (start, end) in _KEYWORD_RANGES:
         if keywords.issubset(token_set):
             return {"start_local": start, "end_local": end}
 
     return None
 
 
+# Span tag -> (RouteCriteria field, normalizer, collects a list). PET and
+# TIMEWIN depend on the intent and are handled in build_route_criteria.
+_TAG_HANDLERS: Dict[str, Tuple[str, Callable[[Sequence[str]], object], bool]] = {
+    "CAT_INC": ("include_categories", _normalize_category, True),
+    "CAT_AVD": ("avoid_categories", _normalize_category, True),
+    "ROUTE_TYPE": ("route_type", _normalize_route_type, False),
+    "DURATION": ("duration_min", _normalize_duration, False),
+    "DISTANCE": ("distance_km", _normalize_distance, False),
+    "RADIUS": ("radius_km", _normalize_distance, False),
+    "ELEV_MIN": ("elevation_gain_min_m", _normalize_elevation, False),
+}
+
+
 def build_route_criteria(intent: str, spans: Sequence[SlotSpan]) -> RouteCriteria:
-    include_categories: List[str] = []
-    avoid_categories: List[str] = []
-    route_type: Optional[str] = None
-    duration_min: Optional[int] = None
-    distance_km: Optional[float] = None
-    radius_km: Optional[float] = None
-    elevation_gain_min_m: Optional[int] = None
-    pet_friendly: Optional[bool] = None
-    time_window: Optional[Dict[str, str]] = None
+    criteria: Dict[str, object] = {}
 
     for span in spans:
         tag = span.label_tag
-        if tag == "CAT_INC":
-            category = _normalize_category(span.tokens)
-            if category and category not in include_categories:
-                include_categories.append(category)
-        elif tag == "CAT_AVD":
-            category = _normalize_category(span.tokens)
-            if category and category not in avoid_categories:
-                avoid_categories.append(category)
-        elif tag == "ROUTE_TYPE":
-            normalized = _normalize_route_type(span.tokens)
-            if normalized:
-                route_type = normalized
-        elif tag == "DURATION":
-            normalized = _normalize_duration(span.tokens)
-            if normalized is not None:
-                duration_min = normalized
-        elif tag == "DISTANCE":
-            normalized = _normalize_distance(span.tokens)
-            if normalized is not None:
-                distance_km = normalized
-        elif tag == "RADIUS":
-            normalized = _normalize_distance(span.tokens)
-            if normalized is not None:
-                radius_km = normalized
-        elif tag == "ELEV_MIN":
-            normalized = _normalize_elevation(span.tokens)
-            if normalized is not None:
-                elevation_gain_min_m = normalized
+        handler = _TAG_HANDLERS.get(tag)
+        if handler is not None:
+            field, normalize, collects_list = handler
+            normalized = normalize(span.tokens)
+            if collects_list:
+                if normalized:
+                    values = criteria.setdefault(field, [])
+                    if normalized not in values:
+                        values.append(normalized)
+            elif normalized is not None:
+                criteria[field] = normalized
         elif tag == "PET":
-            if intent == "negation":
-                pet_friendly = False
-            else:
-                pet_friendly = True
+            criteria["pet_friendly"] = intent != "negation"
         elif tag == "TIMEWIN":
             if intent == "negation":
-                time_window = None
+                criteria.pop("time_window", None)
             else:
                 normalized = _normalize_time_window(span.tokens)
                 if normalized:
-                    time_window = normalized
-
-    criteria = RouteCriteria()
-
-    if include_categories:
-        criteria.include_categories = include_categories
-    if avoid_categories:
-        criteria.avoid_categories = avoid_categories
-    if route_type:
-        criteria.route_type = route_type
-    if duration_min is not None:
-        criteria.duration_min = duration_min
-    if distance_km is not None:
-        criteria.distance_km = distance_km
-    if radius_km is not None:
-        criteria.radius_km = radius_km
-    if elevation_gain_min_m is not None:
-        criteria.elevation_gain_min_m = elevation_gain_min_m
-    if pet_friendly is not None:
-        criteria.pet_friendly = pet_friendly
-    if time_window is not None:
-        criteria.time_window = time_window
-
-    criteria_dict = criteria.dict()
-    return RouteCriteria(**criteria_dict)
+                    criteria["time_window"] = normalized
+
+    return RouteCriteria(**criteria)
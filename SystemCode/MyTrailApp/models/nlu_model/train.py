@@ -3,12 +3,14 @@ from __future__ import annotations
 import argparse
 import json
 import math
+import os
 import random
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 import torch
+from safetensors.torch import save_model
 from seqeval.metrics import f1_score
 from torch.optim import AdamW
 from torch.utils.data import DataLoader
@@ -24,6 +26,9 @@ from src.data_utils import (
 )
 from src.modeling import JointIntentSlotModel
 
+# Training steps between progress-bar loss updates (each update is a device sync)
+LOSS_LOG_INTERVAL = 50
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Joint intent classification and slot filling training script.")
@@ -39,20 +44,38 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--weight_decay", type=float, default=0.01, help="Weight decay.")
     parser.add_argument("--warmup_ratio", type=float, default=0.1, help="Linear warmup ratio.")
     parser.add_argument("--max_grad_norm", type=float, default=1.0, help="Gradient clipping norm.")
+    parser.add_argument(
+        "--grad_accum_steps",
+        type=int,
+        default=1,
+        help="Batches to accumulate per optimizer step (effective batch = train_batch_size * steps).",
+    )
     parser.add_argument("--slot_loss_weight", type=float, default=1.0, help="Weight applied to the slot loss.")
     parser.add_argument("--dropout", type=float, default=0.1, help="Dropout applied before the heads.")
     parser.add_argument("--seed", type=int, default=13, help="Random seed.")
+    parser.add_argument(
+        "--precision",
+        choices=["auto", "fp32", "bf16", "fp16"],
+        default="auto",
+        help="Autocast precision; auto picks bf16 (or fp16) on CUDA and fp32 on CPU.",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the model forward with torch.compile (CUDA with PyTorch 2.x only).",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=max(2, (os.cpu_count() or 2) // 2),
+        help="DataLoader worker processes (tokenization runs in the workers).",
+    )
     parser.add_argument(
         "--output_dir",
         type=Path,
         default=Path("trained_model"),
         help="Directory to save the trained model.",
     )
-    parser.add_argument(
-        "--use_fast_tokenizer",
-        action="store_true",
-        help="Use the fast tokenizer implementation when available.",
-    )
     return parser.parse_args()
 
 
@@ -83,24 +106,39 @@ def create_optimizer(model: JointIntentSlotModel, encoder_lr: float, head_lr: fl
     )
 
 
+def resolve_amp_dtype(precision: str, device: torch.device) -> Optional[torch.dtype]:
+    """Map --precision to the autocast dtype, or None for plain fp32."""
+    if precision == "auto":
+        if device.type != "cuda":
+            return None
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    if precision == "fp16" and device.type != "cuda":
+        raise ValueError("--precision fp16 requires a CUDA device")
+    return {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}[precision]
+
+
 def move_to_device(batch: Dict[str, torch.Tensor], device: torch.device) -> Dict[str, torch.Tensor]:
+    # Asynchronous when the DataLoader pins memory; a plain copy otherwise
     batch_on_device = {
-        "input_ids": batch["input_ids"].to(device),
-        "attention_mask": batch["attention_mask"].to(device),
-        "intent_labels": batch["intent_labels"].to(device),
-        "slot_labels": batch["slot_labels"].to(device),
+        "input_ids": batch["input_ids"].to(device, non_blocking=True),
+        "attention_mask": batch["attention_mask"].to(device, non_blocking=True),
+        "intent_labels": batch["intent_labels"].to(device, non_blocking=True),
+        "slot_labels": batch["slot_labels"].to(device, non_blocking=True),
     }
     return batch_on_device
 
 
-@torch.no_grad()
+@torch.inference_mode()
 def evaluate(
     model: JointIntentSlotModel,
     dataloader: DataLoader,
     label_maps: LabelMaps,
     device: torch.device,
+    amp_dtype: Optional[torch.dtype] = None,
 ) -> Tuple[float, float]:
     model.eval()
+    # Slot ids are contiguous from 0, so an object array decodes a whole sequence in one gather
+    id2slot = np.array([label_maps.id2slot[idx] for idx in range(len(label_maps.id2slot))], dtype=object)
 
     intent_correct = 0
     total_examples = 0
@@ -109,10 +147,11 @@ def evaluate(
 
     for batch in dataloader:
         batch_device = move_to_device(batch, device)
-        outputs = model(
-            input_ids=batch_device["input_ids"],
-            attention_mask=batch_device["attention_mask"],
-        )
+        with torch.autocast(device_type=device.type, dtype=amp_dtype or torch.bfloat16, enabled=amp_dtype is not None):
+            outputs = model(
+                input_ids=batch_device["input_ids"],
+                attention_mask=batch_device["attention_mask"],
+            )
 
         intent_logits = outputs["intent_logits"]
         slot_logits = outputs["slot_logits"]
@@ -125,20 +164,12 @@ def evaluate(
 
         slot_preds = slot_logits.argmax(dim=-1).cpu().numpy()
         slot_labels = batch["slot_labels"].cpu().numpy()
-        word_ids_batch = batch["word_ids"]
-
-        for pred_seq, label_seq, word_ids in zip(slot_preds, slot_labels, word_ids_batch):
-            pred_tags = []
-            true_tags = []
-            for idx, word_id in enumerate(word_ids):
-                if word_id is None:
-                    continue
-                if label_seq[idx] == -100:
-                    continue
-                pred_tags.append(label_maps.id2slot[int(pred_seq[idx])])
-                true_tags.append(label_maps.id2slot[int(label_seq[idx])])
-            all_pred_slots.append(pred_tags)
-            all_true_slots.append(true_tags)
+        word_mask = np.array([[word_id is not None for word_id in word_ids] for word_ids in batch["word_ids"]], dtype=bool)
+        valid = (slot_labels != -100) & word_mask
+
+        for pred_seq, label_seq, mask in zip(slot_preds, slot_labels, valid):
+            all_pred_slots.append(id2slot[pred_seq[mask]].tolist())
+            all_true_slots.append(id2slot[label_seq[mask]].tolist())
 
     intent_accuracy = intent_correct / max(total_examples, 1)
     slot_f1 = f1_score(all_true_slots, all_pred_slots)
@@ -154,6 +185,7 @@ def save_artifacts(
 ) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     torch.save(model.state_dict(), output_dir / "pytorch_model.bin")
+    save_model(model, str(output_dir / "model.safetensors"))
     tokenizer.save_pretrained(output_dir)
     label_data = {
         "intent2id": label_maps.intent2id,
@@ -168,13 +200,15 @@ def save_artifacts(
 
 def main() -> None:
     args = parse_args()
+    if args.grad_accum_steps < 1:
+        raise ValueError("--grad_accum_steps must be at least 1")
     set_seed(args.seed)
 
     train_examples = load_jsonl(args.train_path)
     eval_examples = load_jsonl(args.eval_path)
     label_maps = build_label_maps(train_examples)
 
-    tokenizer = AutoTokenizer.from_pretrained(args.encoder_name, use_fast=args.use_fast_tokenizer)
+    tokenizer = AutoTokenizer.from_pretrained(args.encoder_name, use_fast=True)
 
     train_dataset = IntentSlotDataset(
         train_examples,
@@ -189,17 +223,23 @@ def main() -> None:
         max_length=args.max_length,
     )
 
+    loader_kwargs = {
+        "collate_fn": collate_batch,
+        "num_workers": args.num_workers,
+        "pin_memory": torch.cuda.is_available(),
+        "persistent_workers": args.num_workers > 0,
+    }
     train_loader = DataLoader(
         train_dataset,
         batch_size=args.train_batch_size,
         shuffle=True,
-        collate_fn=collate_batch,
+        **loader_kwargs,
     )
     eval_loader = DataLoader(
         eval_dataset,
         batch_size=args.eval_batch_size,
         shuffle=False,
-        collate_fn=collate_batch,
+        **loader_kwargs,
     )
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -210,40 +250,56 @@ def main() -> None:
         dropout=args.dropout,
         slot_loss_weight=args.slot_loss_weight,
     ).to(device)
+    amp_dtype = resolve_amp_dtype(args.precision, device)
+    # Loss scaling is only needed for fp16; bf16 has the fp32 exponent range
+    scaler = torch.cuda.amp.GradScaler(enabled=amp_dtype == torch.float16)
+    # Compile once and reuse the graph for every epoch. `model` stays the eager
+    # module so optimizer groups and saved state_dict keys are unchanged.
+    forward_model = model
+    if args.compile and device.type == "cuda" and hasattr(torch, "compile"):
+        forward_model = torch.compile(model, mode="max-autotune-no-cudagraphs")
 
     optimizer = create_optimizer(model, args.encoder_lr, args.head_lr, args.weight_decay)
-    total_steps = len(train_loader) * args.epochs
+    steps_per_epoch = math.ceil(len(train_loader) / args.grad_accum_steps)
+    total_steps = steps_per_epoch * args.epochs
     warmup_steps = math.floor(total_steps * args.warmup_ratio)
     scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=warmup_steps, num_training_steps=total_steps)
 
     best_eval_f1 = float("-inf")
 
     for epoch in range(1, args.epochs + 1):
-        model.train()
+        forward_model.train()
         progress_bar = tqdm(train_loader, desc=f"Epoch {epoch}", unit="batch")
-        running_loss = 0.0
+        # Accumulate on the device; .item() forces a host sync, so only read it for the progress bar
+        running_loss = torch.zeros((), device=device)
 
-        for batch in progress_bar:
+        for step, batch in enumerate(progress_bar):
             batch_device = move_to_device(batch, device)
 
-            outputs = model(
-                input_ids=batch_device["input_ids"],
-                attention_mask=batch_device["attention_mask"],
-                intent_labels=batch_device["intent_labels"],
-                slot_labels=batch_device["slot_labels"],
-            )
-            loss = outputs["loss"]
-
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), args.max_grad_norm)
-            optimizer.step()
-            scheduler.step()
-            optimizer.zero_grad()
-
-            running_loss += loss.item()
-            progress_bar.set_postfix(loss=running_loss / (progress_bar.n or 1))
-
-        intent_acc, slot_f1 = evaluate(model, eval_loader, label_maps, device)
+            with torch.autocast(device_type=device.type, dtype=amp_dtype or torch.bfloat16, enabled=amp_dtype is not None):
+                outputs = forward_model(
+                    input_ids=batch_device["input_ids"],
+                    attention_mask=batch_device["attention_mask"],
+                    intent_labels=batch_device["intent_labels"],
+                    slot_labels=batch_device["slot_labels"],
+                )
+                loss = outputs["loss"]
+
+            scaler.scale(loss / args.grad_accum_steps).backward()
+            # Step on every grad_accum_steps-th batch and on the last batch of the epoch
+            if (step + 1) % args.grad_accum_steps == 0 or step + 1 == len(train_loader):
+                scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(model.parameters(), args.max_grad_norm)
+                scaler.step(optimizer)
+                scaler.update()
+                scheduler.step()
+                optimizer.zero_grad(set_to_none=True)
+
+            running_loss += loss.detach().float()
+            if step % LOSS_LOG_INTERVAL == 0:
+                progress_bar.set_postfix(loss=running_loss.item() / (step + 1))
+
+        intent_acc, slot_f1 = evaluate(forward_model, eval_loader, label_maps, device, amp_dtype)
         print(f"Epoch {epoch}: intent_acc={intent_acc:.4f}, slot_f1={slot_f1:.4f}")
 
         if slot_f1 > best_eval_f1 and args.output_dir:
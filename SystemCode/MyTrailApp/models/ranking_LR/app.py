@@ -2,15 +2,17 @@
 from __future__ import annotations
 import os, sys, types, json
 import joblib
+import orjson
 from typing import Any, Dict, List, Optional
 from fastapi import FastAPI, HTTPException, UploadFile, File, Body
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 import waypoint_feature  # Ensure we can import the actual class implementation
 
 DEFAULT_MODEL_PATH = os.getenv("MODEL_PATH", "out/ranking_LR_model.pkl")
 
-app = FastAPI(title="Route Ranker Inference API", version="1.1.0")
+app = FastAPI(title="Route Ranker Inference API", version="1.1.0", default_response_class=ORJSONResponse)
 
 class ModelHolder:
     pipe = None
@@ -19,13 +21,14 @@ class ModelHolder:
     @classmethod
     def _apply_unpickle_shim(cls):
         # Backwards compatibility: older models reference __main__.RouteFeatureExtractor
+        # Applied once at import time; skipped if __main__ already provides the class
         if "__main__" not in sys.modules:
             sys.modules["__main__"] = types.ModuleType("__main__")
-        sys.modules["__main__"].RouteFeatureExtractor = waypoint_feature.RouteFeatureExtractor
+        if not hasattr(sys.modules["__main__"], "RouteFeatureExtractor"):
+            sys.modules["__main__"].RouteFeatureExtractor = waypoint_feature.RouteFeatureExtractor
 
     @classmethod
     def load(cls, path: str):
-        cls._apply_unpickle_shim()
         try:
             pipe = joblib.load(path)
         except Exception as e:
@@ -39,6 +42,9 @@ class ModelHolder:
             cls.load(DEFAULT_MODEL_PATH)
 
 
+ModelHolder._apply_unpickle_shim()
+
+
 @app.on_event("startup")
 def _startup():
     ModelHolder.ensure_loaded()
@@ -52,9 +58,11 @@ def _predict(routes: List[Dict[str, Any]]) -> List[float]:
     ModelHolder.ensure_loaded()
     try:
         preds = ModelHolder.pipe.predict(routes)
-        return [float(p) for p in preds]
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Prediction failed: {e}")
+    if hasattr(preds, "tolist"):
+        return preds.astype(float, copy=False).tolist()
+    return [float(p) for p in preds]
 
 @app.get("/health")
 def health():
@@ -73,14 +81,20 @@ def predict(req: PredictRequest):
         items.append(x)
     return {"count": len(items), "items": items}
 
+def _loads(raw: bytes) -> Any:
+    # orjson parses the bytes directly; it rejects NaN/Infinity, which the stdlib json still accepts
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw)
+
 @app.post("/predict_file")
 async def predict_file(file: UploadFile = File(...), return_items: bool = True):
-    raw = await file.read()
-    text = raw.decode("utf-8").strip()
-    if not text:
+    raw = (await file.read()).strip()
+    if not raw:
         raise HTTPException(status_code=400, detail="Empty file")
     try:
-        routes = json.loads(text) if text[0] == "[" else [json.loads(l) for l in text.splitlines() if l.strip()]
+        routes = _loads(raw) if raw[:1] == b"[" else [_loads(l) for l in raw.splitlines() if l.strip()]
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse uploaded file: {e}")
     preds = _predict(routes)
@@ -1,38 +1,71 @@
 import json
+import logging
+import math
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_SCENIC = frozenset({"nature", "park", "water"})
 
 def clamp(x, lo=0.0, hi=1.0):
     return max(lo, min(hi, x))
 
-def compute_score(route):
-    waypoints = route.get("waypoints", [])
-    distance_m = route.get("distance", 0)
-    metadata = route.get("metadata", {})
+def _clamp_array(x, lo=0.0, hi=1.0):
+    # Same as clamp() elementwise, including NaN -> hi
+    return np.clip(np.where(np.isnan(x), hi, x), lo, hi)
+
+def _has_non_finite(obj):
+    """True if obj holds a NaN/Infinity float, which orjson would write as null."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(v) for v in obj)
+    return False
+
+def _fold_route(route):
+    """Reduce one route to the inputs of its score, walking the waypoints once.
+
+    Returns (rating_sum, rating_count, n_categories, scenic_bonus, loop_bonus, distance_m).
+    """
+    rating_sum = 0.0
+    rating_count = 0
+    cats = set()
+    scenic = False
+    for wp in route.get("waypoints", []):
+        r = wp.get("rating")
+        if isinstance(r, (int, float)):
+            rating_sum += r
+            rating_count += 1
+        search_cat = wp.get("search_category")
+        cat = search_cat or wp.get("category") or ""
+        cats.add(cat.lower() if cat else "")
+        # Only search_category counts here; the plain category fallback does not earn the bonus
+        if search_cat and not scenic:
+            scenic = search_cat.lower() in _SCENIC
+    loop = route.get("metadata", {}).get("route_type", "").lower() == "loop"
+    return (rating_sum, rating_count, len(cats), float(scenic), float(loop), float(route.get("distance", 0)))
+
+def _score_folded(folded):
+    if not folded:
+        return np.zeros(0)
+    rating_sum, rating_count, n_categories, scenic_bonus, loop_bonus, distance_m = np.array(folded, dtype=np.float64).T
 
     # ---- 1. Average rating ----
-    ratings = [wp.get("rating", 0) for wp in waypoints if isinstance(wp.get("rating"), (int, float))]
-    rating_score = clamp(sum(ratings) / len(ratings) / 5.0, 0, 1) if ratings else 0.5
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rating_score = np.where(rating_count > 0, _clamp_array(rating_sum / rating_count / 5.0), 0.5)
 
     # ---- 2. Route length preference (3–7 km ideal) ----
     km = distance_m / 1000.0
-    if km < 3:
-        length_score = (km - 1) / 2 if km > 1 else 0
-    elif km <= 7:
-        length_score = 1
-    elif km < 12:
-        length_score = (12 - km) / 5
-    else:
-        length_score = 0
-    length_score = clamp(length_score)
+    # Ramp up from 1 km, flat on [3, 7] km, ramp down to 0 at 12 km
+    length_score = np.clip(np.minimum((km - 1) / 2, (12 - km) / 5), 0.0, 1.0)
+    length_score[np.isnan(km)] = 0.0
 
     # ---- 3. Category diversity ----
-    cats = { (wp.get("search_category") or wp.get("category") or "").lower() for wp in waypoints }
-    diversity_score = clamp(len(cats) / 4.0)
-
-    # ---- 4. Scenic bonus ----
-    scenic_bonus = 1.0 if any((wp.get("search_category") or "").lower() in ["nature", "park", "water"] for wp in waypoints) else 0.0
-
-    # ---- 5. Loop bonus ----
-    loop_bonus = 1.0 if metadata.get("route_type", "").lower() == "loop" else 0.0
+    diversity_score = _clamp_array(n_categories / 4.0)
 
     # ---- 6. Overall score (extra weight for search_category) ----
     # Weights: rating 0.15, length 0.15, diversity 0.10, scenic 0.40, loop 0.20
@@ -43,7 +76,15 @@ def compute_score(route):
         0.40 * scenic_bonus +
         0.20 * loop_bonus
     )
-    return round(clamp(score), 4)
+    # Python round() per element keeps results identical to the scalar scores
+    return np.array([round(s, 4) for s in _clamp_array(score).tolist()])
+
+def compute_scores(routes):
+    """Score a batch of routes at once; returns a float64 array aligned with routes."""
+    return _score_folded([_fold_route(route) for route in routes])
+
+def compute_score(route):
+    return float(compute_scores([route])[0])
 
 def main():
     input_file = "data/synthetic_data.json"
@@ -55,19 +96,33 @@ def main():
     # Supports two structures: a list or {"routes": [...]}
     if isinstance(data, dict) and "routes" in data:
         routes = data["routes"]
-        for r in routes:
-            r["score"] = compute_score(r)
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump({"routes": routes}, f, ensure_ascii=False, indent=2)
+        output = {"routes": routes}
     elif isinstance(data, list):
-        for r in data:
-            r["score"] = compute_score(r)
+        routes = output = data
+    else:
+        logger.error("❌ Invalid JSON format; expected a list or an object containing a 'routes' key")
+        return
+
+    for r, score in zip(routes, compute_scores(routes).tolist()):
+        r["score"] = score
+    # orjson writes UTF-8 bytes straight to the file, without building the indented str first.
+    # json.load accepts NaN/Infinity, which orjson would turn into null, so such
+    # input keeps the json module's output.
+    encoded = None
+    if not _has_non_finite(output):
+        try:
+            encoded = orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:  # e.g. integers beyond 64 bits
+            pass
+    if encoded is None:
         with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            json.dump(output, f, ensure_ascii=False, indent=2)
     else:
-        print("❌ Invalid JSON format; expected a list or an object containing a 'routes' key")
+        with open(output_file, "wb") as f:
+            f.write(encoded)
 
-    print("✅ Scoring complete; results saved to:", output_file)
+    logger.info("✅ Scoring complete; results saved to: %s", output_file)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     main()
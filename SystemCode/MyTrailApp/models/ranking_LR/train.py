@@ -5,7 +5,7 @@ Route Ranking — Linear Regression (scikit-learn)
 
 • Extracts engineered features from each route + its waypoints
 • Trains a LinearRegression model to predict a numeric score
-• Saves a single .pkl containing a full sklearn Pipeline (vectorizer + model)
+• Saves a single .pkl containing a full sklearn Pipeline (feature extractor + model)
 • Supports batch scoring on new routes with the same schema
 
 Input training data format (JSON or JSONL):
@@ -31,10 +31,15 @@ Train:
 
 Predict (score new routes):
   python train.py predict --model model/route_ranker.pkl --data data/new_routes.json --out data/new_routes_scored.json
+  # or with the coefficient file written next to the .pkl (no unpickling):
+  python train.py predict --model model/route_ranker.npz --data data/new_routes.json --out data/new_routes_scored.json
+  # an --out ending in .jsonl is written one scored route per line, chunk by chunk
 
 Notes
 -----
 • The saved .pkl is a sklearn Pipeline and can be loaded to score any future route dicts.
+• Training also writes a .npz with the vectorizer's feature names and the linear weights;
+  scoring from it is just features → dense matrix → X @ w + b.
 • Feature set is intentionally generic & robust to missing fields.
 """
 
@@ -44,11 +49,12 @@ import json
 import math
 import os
 import random
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
+import orjson
+from scoring import _has_non_finite
 from waypoint_feature import RouteFeatureExtractor, _to_seconds, _safe_float, _polyline_bbox_area_km2
-from sklearn.feature_extraction import DictVectorizer
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.model_selection import train_test_split
@@ -60,23 +66,57 @@ import joblib
 # IO helpers
 #############################
 
+def _loads(text: str) -> Any:
+    # orjson is several times faster; it rejects NaN/Infinity literals, so fall back to json
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+
+def _dumps(obj: Any) -> bytes:
+    """UTF-8 JSON indented by 2, as json.dump(..., ensure_ascii=False, indent=2) writes it."""
+    # orjson would write NaN/Infinity (which _loads accepts) as null
+    if not _has_non_finite(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except orjson.JSONEncodeError:  # e.g. integers beyond 64 bits
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _dumps_line(obj: Any) -> bytes:
+    """Compact UTF-8 JSON followed by a newline, for one JSONL record."""
+    if not _has_non_finite(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            pass
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
 def _load_routes(path: str) -> List[Dict[str, Any]]:
     """Load JSON array or JSONL file of route dicts."""
     with open(path, "r", encoding="utf-8") as f:
-        text = f.read().strip()
-        if not text:
+        # Sniff the first non-whitespace character instead of reading the whole file
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if not first:
             return []
-        if text[0] == "[":
-            data = json.loads(text)
+        if first == "[":
+            f.seek(0)
+            data = _loads(f.read())
             assert isinstance(data, list), "Expected a JSON array at top-level"
             return data
-        # otherwise JSONL
+        # otherwise JSONL, parsed one line at a time
+        f.seek(0)
         routes: List[Dict[str, Any]] = []
-        for line in text.splitlines():
+        for line in f:
             line = line.strip()
             if not line:
                 continue
-            routes.append(json.loads(line))
+            routes.append(_loads(line))
         return routes
 
 
@@ -95,6 +135,60 @@ def _extract_xy(routes: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], np.
         raise ValueError("No labeled routes with 'score' found in the dataset.")
     return X, np.array(y_list, dtype=float), ids
 
+#############################
+# Linear coefficient file (.npz)
+#############################
+
+def _save_linear_npz(pipe: Pipeline, path: str) -> None:
+    """Persist only what inference needs: feature names, weights and intercept."""
+    lr: LinearRegression = pipe.named_steps["lr"]
+    # Pipelines saved before the extractor emitted a matrix carry a DictVectorizer step
+    columns = pipe.named_steps["dv"] if "dv" in pipe.named_steps else pipe.named_steps["fe"]
+    np.savez(
+        path,
+        names=np.array(columns.feature_names_),
+        # float64 like the extractor's matrix; see RouteFeatureExtractor._to_matrix
+        w=np.asarray(lr.coef_, dtype=np.float64),
+        b=np.float64(lr.intercept_),
+    )
+
+
+def _load_linear_npz(path: str) -> Callable[[List[Dict[str, Any]]], np.ndarray]:
+    """Equivalent of pipe.predict for a Pipeline saved by _save_linear_npz."""
+    with np.load(path) as npz:
+        names, w, b = npz["names"].tolist(), npz["w"], float(npz["b"])
+    fe = RouteFeatureExtractor()
+    fe.feature_names_ = names
+    fe.feature_index_ = {name: j for j, name in enumerate(names)}
+
+    def predict(routes: List[Dict[str, Any]]) -> np.ndarray:
+        X = fe.transform(routes)
+        # Same contract as LinearRegression.predict
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        return X @ w + b
+
+    return predict
+
+
+SCORE_CHUNK_SIZE = 4096
+
+
+def _load_predictor(model_path: str) -> Callable[[List[Dict[str, Any]]], np.ndarray]:
+    if model_path.endswith(".npz"):
+        return _load_linear_npz(model_path)
+    pipe: Pipeline = joblib.load(model_path)
+    return pipe.predict
+
+
+def _iter_predictions(
+    predict: Callable[[List[Dict[str, Any]]], np.ndarray], routes: List[Dict[str, Any]]
+) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+    """Yield (routes, predictions) per chunk, so only one chunk's feature matrix exists at a time."""
+    for start in range(0, len(routes), SCORE_CHUNK_SIZE):
+        chunk = routes[start:start + SCORE_CHUNK_SIZE]
+        yield chunk, predict(chunk)
+
 #############################
 # Train & Predict
 #############################
@@ -108,7 +202,6 @@ def train_cmd(args: argparse.Namespace) -> None:
     pipe = Pipeline(
         steps=[
             ("fe", fe),
-            ("dv", DictVectorizer(sparse=False)),
             ("lr", LinearRegression())
         ]
     )
@@ -130,8 +223,14 @@ def train_cmd(args: argparse.Namespace) -> None:
 
     # Save model pipeline
     os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    joblib.dump(pipe, args.out)
+    # zlib level 3 needs no extra package wherever the .pkl is loaded (app.py, backend).
+    # joblib cannot memory-map a compressed file; the small coefficient arrays
+    # gain nothing from mmap anyway, and the .npz below is the fast-loading artifact.
+    joblib.dump(pipe, args.out, compress=3)
     print(f"Saved model pipeline to: {args.out}")
+    npz_path = os.path.splitext(args.out)[0] + ".npz"
+    _save_linear_npz(pipe, npz_path)
+    print(f"Saved linear coefficients to: {npz_path}")
 
     # Optionally score the training set (or a provided --score-on file) for quick sanity check
     if args.score_on:
@@ -140,23 +239,33 @@ def train_cmd(args: argparse.Namespace) -> None:
 
 
 def score_cmd(args: argparse.Namespace) -> None:
-    pipe: Pipeline = joblib.load(args.model)
     routes = _load_routes(args.data)
-
-    # Predict scores for each route (no requirement for 'score' field here)
-    preds = pipe.predict(routes)
-
-    # Attach predictions and write out
-    out_items = []
-    for r, p in zip(routes, preds):
-        item = dict(r)
-        item["predicted_score"] = float(p)
-        out_items.append(item)
+    predict = _load_predictor(args.model)
 
     os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out_items, f, ensure_ascii=False, indent=2)
-    print(f"Wrote {len(out_items)} scored routes → {args.out}")
+    # Predict scores chunk by chunk (no requirement for 'score' field here)
+    if args.out.endswith(".jsonl"):
+        # One line per route, streamed as each chunk is scored
+        n_written = 0
+        with open(args.out, "wb") as f:
+            for chunk, preds in _iter_predictions(predict, routes):
+                for r, p in zip(chunk, preds):
+                    item = dict(r)
+                    item["predicted_score"] = float(p)
+                    f.write(_dumps_line(item))
+                n_written += len(chunk)
+    else:
+        # Attach predictions and write out as one JSON array
+        out_items = []
+        for chunk, preds in _iter_predictions(predict, routes):
+            for r, p in zip(chunk, preds):
+                item = dict(r)
+                item["predicted_score"] = float(p)
+                out_items.append(item)
+        with open(args.out, "wb") as f:
+            f.write(_dumps(out_items))
+        n_written = len(out_items)
+    print(f"Wrote {n_written} scored routes → {args.out}")
 
 #############################
 # CLI
@@ -177,10 +286,10 @@ def build_arg_parser() -> argparse.ArgumentParser:
     p_train.set_defaults(func=train_cmd)
 
     # Predict
-    p_pred = sub.add_parser("predict", help="Load .pkl and score new routes")
-    p_pred.add_argument("--model", required=True, help="Path to saved sklearn Pipeline .pkl")
+    p_pred = sub.add_parser("predict", help="Load .pkl (or .npz) and score new routes")
+    p_pred.add_argument("--model", required=True, help="Path to saved sklearn Pipeline .pkl or linear coefficient .npz")
     p_pred.add_argument("--data", required=True, help="Path to JSON or JSONL with new routes")
-    p_pred.add_argument("--out", "--output", dest="out", required=True, help="Where to write JSON with predicted_score field")
+    p_pred.add_argument("--out", "--output", dest="out", required=True, help="Where to write JSON with predicted_score field (.jsonl: one route per line)")
     p_pred.set_defaults(func=score_cmd)
 
     return p
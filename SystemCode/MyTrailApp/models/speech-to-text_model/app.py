@@ -1,14 +1,37 @@
+import functools
+import io
 import os
-import subprocess
-import tempfile
-from typing import Dict, Optional
+import queue
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
 
+import av
+import numpy as np
 import torch
 import torchaudio
 from flask import Flask, jsonify, request
 from transformers import WhisperForConditionalGeneration, WhisperProcessor
 
 
+# Dynamic batching: concurrent /transcribe requests that arrive within
+# BATCH_WINDOW_MS of each other share one model.generate call
+MAX_BATCH_SIZE = int(os.environ.get("WHISPER_MAX_BATCH", "8"))
+BATCH_WINDOW_MS = float(os.environ.get("WHISPER_BATCH_WINDOW_MS", "20"))
+
+
+class _PendingTranscription:
+    """One queued request; `done` is set once `text` or `error` is filled in."""
+
+    def __init__(self, input_features: torch.Tensor, key: Tuple[Optional[str], str], generate_kwargs: Dict):
+        self.input_features = input_features
+        self.key = key
+        self.generate_kwargs = generate_kwargs
+        self.done = threading.Event()
+        self.text: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
 def create_app() -> Flask:
     app = Flask(__name__)
 
@@ -33,48 +56,67 @@ def create_app() -> Flask:
             "Unable to load WhisperProcessor. Ensure 'preprocessor_config.json' is present "
             "either in the model directory or in a 'processor' subdirectory."
         )
-    model = WhisperForConditionalGeneration.from_pretrained(model_dir, local_files_only=True)
-
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Half-width weights with fused SDPA attention on GPU; fp32 on CPU
+    model_kwargs = {"torch_dtype": torch.float16} if device.type == "cuda" else {}
+    try:
+        model = WhisperForConditionalGeneration.from_pretrained(
+            model_dir, attn_implementation="sdpa", local_files_only=True, **model_kwargs
+        )
+    except (ImportError, ValueError):
+        # SDPA needs torch>=2.1.1; fall back to the eager attention implementation
+        model = WhisperForConditionalGeneration.from_pretrained(model_dir, local_files_only=True, **model_kwargs)
     model.to(device)
     model.eval()
 
-    target_sample_rate: int = processor.feature_extractor.sampling_rate
+    # The encoder always sees the fixed 30 s log-mel window, so on GPU it is
+    # compiled once and warmed up here rather than on the first request. The
+    # decoder loop in generate stays eager: transformers 4.39 has no static KV
+    # cache for Whisper, and a growing cache would recompile every step.
+    if device.type == "cuda" and hasattr(torch, "compile") and os.environ.get("WHISPER_COMPILE", "1") != "0":
+        encoder = model.get_encoder()
+        encoder.forward = torch.compile(encoder.forward)
+        n_frames = 2 * model.config.max_source_positions  # conv stride 2
+        # Batch 1 gets its own specialized graph; the second size makes dynamo
+        # compile one graph with a dynamic batch dim, covering every batch the
+        # dispatcher can build up to MAX_BATCH_SIZE without recompiling later.
+        with torch.inference_mode():
+            for batch_size in (1, 2):
+                encoder(torch.zeros(batch_size, model.config.num_mel_bins, n_frames, device=device, dtype=model.dtype))
 
-    def _prepare_waveform(path: str) -> torch.Tensor:
+    feature_extractor = processor.feature_extractor
+    target_sample_rate: int = feature_extractor.sampling_rate
+    # Whisper's log-mel front end, kept on the model's device so audio only
+    # crosses to the GPU once (as the raw waveform)
+    mel_filters = torch.from_numpy(feature_extractor.mel_filters).to(device=device, dtype=torch.float32)
+    stft_window = torch.hann_window(feature_extractor.n_fft, device=device)
+
+    def _decode_with_av(source: BinaryIO) -> Tuple[torch.Tensor, int]:
+        """Decode any FFmpeg-readable stream in process as mono float32 at the target rate."""
+        chunks: List[np.ndarray] = []
+        with av.open(source) as container:
+            stream = container.streams.audio[0]
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=target_sample_rate)
+            for frame in container.decode(stream):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+            # Flush samples still buffered in the resampler
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+        samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        return torch.from_numpy(samples).unsqueeze(0), target_sample_rate
+
+    def _prepare_waveform(data: bytes, audio_format: Optional[str]) -> torch.Tensor:
+        # File-like objects carry no name, so the upload's extension is passed as the format hint
         try:
-            waveform, sample_rate = torchaudio.load(path)
+            waveform, sample_rate = torchaudio.load(io.BytesIO(data), format=audio_format)
         except RuntimeError:
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as converted:
-                converted_path = converted.name
             try:
-                subprocess.run(
-                    [
-                        "ffmpeg",
-                        "-hide_banner",
-                        "-loglevel",
-                        "error",
-                        "-y",
-                        "-i",
-                        path,
-                        "-ac",
-                        "1",
-                        "-ar",
-                        str(target_sample_rate),
-                        converted_path,
-                    ],
-                    check=True,
-                )
-                waveform, sample_rate = torchaudio.load(converted_path)
-            except (subprocess.CalledProcessError, RuntimeError) as exc:
+                waveform, sample_rate = _decode_with_av(io.BytesIO(data))
+            except (av.error.FFmpegError, IndexError) as exc:
                 raise RuntimeError(
-                    "Failed to load audio. Ensure FFmpeg is installed and the file is a supported format."
+                    "Failed to load audio. Ensure the file is a supported audio format."
                 ) from exc
-            finally:
-                try:
-                    os.unlink(converted_path)
-                except OSError:
-                    pass
 
         if waveform.ndim == 2 and waveform.shape[0] > 1:
             # Convert multi-channel audio to mono by averaging channels.
@@ -89,19 +131,91 @@ def create_app() -> Flask:
 
         return waveform
 
+    def _log_mel_features(waveform: torch.Tensor) -> torch.Tensor:
+        """Same features as WhisperFeatureExtractor, computed on `device`."""
+        if device.type == "cuda":
+            waveform = waveform.pin_memory()
+        waveform = waveform.to(device=device, dtype=torch.float32, non_blocking=True)
+
+        # Pad or trim to the fixed 30 s window the model was trained on
+        n_samples = feature_extractor.n_samples
+        if waveform.shape[-1] >= n_samples:
+            waveform = waveform[:n_samples]
+        else:
+            waveform = torch.nn.functional.pad(waveform, (0, n_samples - waveform.shape[-1]))
+
+        stft = torch.stft(
+            waveform,
+            feature_extractor.n_fft,
+            feature_extractor.hop_length,
+            window=stft_window,
+            return_complex=True,
+        )
+        magnitudes = stft[..., :-1].abs() ** 2
+        log_spec = torch.clamp(mel_filters.T @ magnitudes, min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+        return ((log_spec + 4.0) / 4.0).unsqueeze(0)
+
+    @functools.lru_cache(maxsize=64)
+    def _decoder_prompt_ids(language: str, task: str) -> Tuple[Tuple[int, int], ...]:
+        # Unsupported languages raise ValueError, which lru_cache does not store
+        prompt_ids = processor.get_decoder_prompt_ids(language=language, task=task)
+        return tuple(tuple(pair) for pair in prompt_ids)
+
     def _get_generate_kwargs(language: Optional[str], task: str) -> Dict:
         if not language:
             return {}
         try:
-            forced_decoder_ids = processor.get_decoder_prompt_ids(
-                language=language, task=task
-            )
+            prompt_ids = _decoder_prompt_ids(language, task)
         except ValueError as exc:
             raise ValueError(
                 f"Unsupported language '{language}'. "
                 "Use ISO-639-1 codes, e.g. 'en', 'zh', 'de'."
             ) from exc
-        return {"forced_decoder_ids": forced_decoder_ids}
+        # Fresh lists per request so generate never shares the cached ids
+        return {"forced_decoder_ids": [list(pair) for pair in prompt_ids]}
+
+    # Warm the cache with the common case for this English fine-tune
+    _decoder_prompt_ids("en", "transcribe")
+
+    pending: "queue.Queue[_PendingTranscription]" = queue.Queue()
+
+    def _collect_batch() -> List[_PendingTranscription]:
+        batch = [pending.get()]
+        deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+        while len(batch) < MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batches() -> None:
+        while True:
+            batch = _collect_batch()
+            # Only requests with the same decoder prompt (language, task) can share a generate call
+            groups: Dict[Tuple[Optional[str], str], List[_PendingTranscription]] = {}
+            for item in batch:
+                groups.setdefault(item.key, []).append(item)
+            for items in groups.values():
+                try:
+                    with torch.inference_mode():
+                        input_features = torch.cat([item.input_features for item in items])
+                        predicted_ids = model.generate(input_features, **items[0].generate_kwargs)
+                    texts = processor.batch_decode(predicted_ids, skip_special_tokens=True)
+                    for item, text in zip(items, texts):
+                        item.text = text
+                except Exception as exc:
+                    for item in items:
+                        item.error = exc
+                finally:
+                    for item in items:
+                        item.done.set()
+
+    threading.Thread(target=_run_batches, name="whisper-batcher", daemon=True).start()
 
     @app.route("/health", methods=["GET"])
     def health() -> tuple:
@@ -126,24 +240,19 @@ def create_app() -> Flask:
         except ValueError as exc:
             return jsonify({"error": str(exc)}), 400
 
-        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(uploaded_file.filename)[1]) as tmp:
-            uploaded_file.save(tmp.name)
-            waveform = _prepare_waveform(tmp.name)
-
-        inputs = processor(
-            waveform.numpy(),
-            sampling_rate=target_sample_rate,
-            return_tensors="pt",
-        )
-
-        input_features = inputs.input_features.to(device)
+        # Decode straight from the request body instead of a temporary file
+        audio_format = os.path.splitext(uploaded_file.filename)[1].lstrip(".").lower() or None
+        waveform = _prepare_waveform(uploaded_file.read(), audio_format)
 
         with torch.inference_mode():
-            predicted_ids = model.generate(input_features, **generate_kwargs)
+            input_features = _log_mel_features(waveform).to(model.dtype)
 
-        transcription = processor.batch_decode(
-            predicted_ids, skip_special_tokens=True
-        )[0]
+        item = _PendingTranscription(input_features, (language, task), generate_kwargs)
+        pending.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        transcription = item.text
 
         detected_language = language or getattr(processor.tokenizer, "language", None)
 